@@ -2,26 +2,14 @@ from django import forms
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Coalesce
 from django.forms.widgets import DateInput
 from django.utils.html import format_html
 from datetime import date
 
-from .models import UserProfile, Scheme, MonthlyCharge, MonthlyReward
-
-
-# -------------------------------------------------------------------
-# HELPER: SAFE MONTH RANGE WITHOUT dateutil
-# -------------------------------------------------------------------
-def generate_months(start, end):
-    months = []
-    y, m = start.year, start.month
-    while (y < end.year) or (y == end.year and m <= end.month):
-        months.append(date(y, m, 1))
-        m += 1
-        if m > 12:
-            m = 1
-            y += 1
-    return months
+from .models import UserProfile, Scheme, MonthlyCharge, MonthlyReward, EmailOutbox, MonthlyJob, SchedulerRun
+from .utils import mark_paid, save_charge
 
 
 # -------------------------------------------------------------------
@@ -62,6 +50,12 @@ class MonthlyChargeAdminForm(forms.ModelForm):
         except UserProfile.DoesNotExist:
             raise forms.ValidationError("Invalid Member ID")
 
+        month = cleaned.get("charge_month")
+        if month and MonthlyCharge.objects.filter(
+            user=profile.user, charge_month=month
+        ).exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError("This member already has a charge for that month")
+
         return cleaned
 
     def save(self, commit=True):
@@ -69,21 +63,27 @@ class MonthlyChargeAdminForm(forms.ModelForm):
         obj.user = self.cleaned_data["user"]
 
         if commit:
-            obj.save()
-
             # Auto reward
-            if obj.paid:
-                MonthlyReward.objects.update_or_create(
-                    user=obj.user,
-                    reward_month=obj.charge_month,
-                    defaults={"reward_text": self.cleaned_data["scheme"].monthly_reward_text}
-                )
+            save_charge(obj)
         return obj
 
 
 class MonthlyChargeAdmin(admin.ModelAdmin):
     form = MonthlyChargeAdminForm
     list_display = ("user", "charge_month", "paid", "created_at")
+    actions = ["mark_selected_paid"]
+
+    def save_model(self, request, obj, form, change):
+        save_charge(obj)
+
+    @admin.action(description="Mark selected charges paid")
+    def mark_selected_paid(self, request, queryset):
+        result = mark_paid(queryset.values_list("user_id", "charge_month"))
+        self.message_user(
+            request,
+            "{updated} marked paid, {skipped} skipped (already paid or no scheme), "
+            "{rewards} rewards written.".format(**result),
+        )
 
 
 admin.site.register(MonthlyCharge, MonthlyChargeAdmin)
@@ -103,6 +103,30 @@ class MonthlyRewardAdmin(admin.ModelAdmin):
 admin.site.register(MonthlyReward, MonthlyRewardAdmin)
 
 
+# -------------------------------------------------------------------
+# ARREARS FILTER
+# -------------------------------------------------------------------
+class ArrearsFilter(admin.SimpleListFilter):
+    title = "arrears (billed months unpaid)"
+    parameter_name = "arrears"
+
+    def lookups(self, request, model_admin):
+        return (
+            ("none", "Up to date"),
+            ("1-2", "1-2 months"),
+            ("3+", "3+ months"),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == "none":
+            return queryset.filter(pending_count=0)
+        if self.value() == "1-2":
+            return queryset.filter(pending_count__range=(1, 2))
+        if self.value() == "3+":
+            return queryset.filter(pending_count__gte=3)
+        return queryset
+
+
 # -------------------------------------------------------------------
 # SAFE USER ADMIN
 # -------------------------------------------------------------------
@@ -114,6 +138,30 @@ class UserAdminWithProfile(UserAdmin):
         "get_member_id", "monthly_charge_status",
         "pending_months", "mark_paid_button", "is_staff"
     )
+    list_filter = UserAdmin.list_filter + (ArrearsFilter,)
+    actions = ["mark_this_month_paid"]
+
+    def get_queryset(self, request):
+        """
+        Annotate the paid state of this month and the months pending, so the
+        changelist columns need no per-row queries. Pending is the number of
+        months billed to the member and not paid (app.utils.PENDING_CHARGE),
+        read from their ledger summary. Months since joining that were never
+        billed are not pending.
+        """
+        today = date.today().replace(day=1)
+        paid_this_month = MonthlyCharge.objects.filter(
+            user=OuterRef("pk"), paid=True, charge_month=today
+        )
+
+        return (
+            super().get_queryset(request)
+            .select_related("userprofile")
+            .annotate(
+                paid_this_month=Exists(paid_this_month),
+                pending_count=Coalesce("ledger_summary__months_pending", 0),
+            )
+        )
 
     def get_member_id(self, obj):
         try:
@@ -123,34 +171,14 @@ class UserAdminWithProfile(UserAdmin):
     get_member_id.short_description = "Member ID"
 
     def monthly_charge_status(self, obj):
-        try:
-            today = date.today().replace(day=1)
-            paid = MonthlyCharge.objects.filter(
-                user=obj, charge_month=today, paid=True
-            ).exists()
-            return "✔ Paid" if paid else "⚠ Pending"
-        except:
-            return "?"
+        return "✔ Paid" if obj.paid_this_month else "⚠ Pending"
     monthly_charge_status.short_description = "This Month"
+    monthly_charge_status.admin_order_field = "paid_this_month"
 
     def pending_months(self, obj):
-        try:
-            start = obj.date_joined.date().replace(day=1)
-        except:
-            return "?"
-
-        today = date.today().replace(day=1)
-
-        all_months = generate_months(start, today)
-        paid_months = MonthlyCharge.objects.filter(
-            user=obj, paid=True
-        ).values_list("charge_month", flat=True)
-
-        paid_set = set([d.replace(day=1) for d in paid_months])
-        pending = [m for m in all_months if m not in paid_set]
-
-        return f"{len(pending)}"
-    pending_months.short_description = "Pending"
+        return f"{obj.pending_count}"
+    pending_months.short_description = "Pending (billed, unpaid)"
+    pending_months.admin_order_field = "pending_count"
 
     def mark_paid_button(self, obj):
         return format_html(
@@ -161,9 +189,55 @@ class UserAdminWithProfile(UserAdmin):
         )
     mark_paid_button.short_description = "Quick Pay"
 
+    @admin.action(description="Mark this month paid for selected users")
+    def mark_this_month_paid(self, request, queryset):
+        today = date.today().replace(day=1)
+        result = mark_paid((user_id, today) for user_id in queryset.values_list("pk", flat=True))
+        self.message_user(
+            request,
+            "{created} charges created, {updated} marked paid, "
+            "{skipped} skipped (already paid or no scheme).".format(**result),
+        )
+
 
 admin.site.unregister(User)
 admin.site.register(User, UserAdminWithProfile)
 
 admin.site.register(Scheme)
 admin.site.register(UserProfile)
+
+
+# -------------------------------------------------------------------
+# EMAIL OUTBOX ADMIN
+# -------------------------------------------------------------------
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ("to_email", "subject", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status",)
+    readonly_fields = ("created_at", "sent_at", "last_error")
+
+
+admin.site.register(EmailOutbox, EmailOutboxAdmin)
+
+
+# -------------------------------------------------------------------
+# MONTHLY JOB ADMIN
+# -------------------------------------------------------------------
+class MonthlyJobAdmin(admin.ModelAdmin):
+    list_display = ("month", "status", "members_done", "members_total", "inserted", "created_at", "finished_at")
+    list_filter = ("status",)
+    readonly_fields = ("created_at", "started_at", "heartbeat_at", "finished_at", "error")
+
+
+admin.site.register(MonthlyJob, MonthlyJobAdmin)
+
+
+# -------------------------------------------------------------------
+# SCHEDULER RUN ADMIN
+# -------------------------------------------------------------------
+class SchedulerRunAdmin(admin.ModelAdmin):
+    list_display = ("month", "status", "catch_up", "owner", "inserted", "duration", "started_at")
+    list_filter = ("status", "catch_up")
+    readonly_fields = ("started_at", "finished_at", "error")
+
+
+admin.site.register(SchedulerRun, SchedulerRunAdmin)
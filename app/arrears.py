@@ -0,0 +1,186 @@
+from datetime import date
+
+from django.db.models import BigIntegerField, Func, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+from app.cache import scheme_catalog
+from app.models import MonthlyCharge, UserProfile
+from app.utils import PENDING_CHARGE, current_month
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+
+# --------------------------
+# Arrears engine
+# --------------------------
+# A month is pending for a member when it was billed and not paid
+# (app.utils.PENDING_CHARGE), the same as on every other screen. The
+# database folds each member's pending months into a bitmask (one query per
+# 62 months of window), and the arrears of the whole membership are computed
+# from the resulting members x months grid at once.
+# The grid is a NumPy boolean matrix when NumPy is installed and one int
+# bitset per member otherwise.
+
+# Months per mask query; bit 62 is the highest a signed 64-bit SUM can hold
+MASK_MONTHS = 62
+
+ARREARS_CSV_HEADER = [
+    "Member ID", "Name", "Scheme", "Months Pending", "Longest Unpaid Streak", "Amount Owed",
+]
+
+
+def _month_number(year, month):
+    return year * 12 + month
+
+
+def _month_expression(field):
+    return ExtractYear(field) * 12 + ExtractMonth(field)
+
+
+def _month_date(number):
+    year, month = divmod(number - 1, 12)
+    return date(year, month + 1, 1)
+
+
+class _Bit(Func):
+    template = "(1 << %(expressions)s)"
+    output_field = BigIntegerField()
+
+
+def _longest_run(bits):
+    """Length of the longest run of set bits in an int."""
+    run = 0
+    while bits:
+        bits &= bits >> 1
+        run += 1
+    return run
+
+
+class Arrears:
+    """
+    Arrears of every member over a window of months ending this month.
+
+    `user_ids`, `pending`, `longest_streak` and `owed` are parallel
+    sequences with one entry per member; `members` holds the display
+    details by user id.
+    """
+
+    def __init__(self, months=60):
+        today = current_month()
+        self.last = _month_number(today.year, today.month)
+        self.first = self.last - months + 1
+        self.months = months
+
+        self.members = {}
+        charges = []
+        profiles = list(
+            UserProfile.objects.filter(user__is_superuser=False).order_by("user_id")
+            .values_list(
+                "user_id", "member_id", "scheme_id", "user__first_name", "user__last_name",
+            )
+        )
+        schemes = scheme_catalog(require={p[2] for p in profiles if p[2] is not None})
+        for user_id, member_id, scheme_id, first_name, last_name in profiles:
+            scheme = schemes.get(scheme_id)
+            self.members[user_id] = {
+                "member_id": member_id,
+                "name": f"{first_name} {last_name}".strip(),
+                "scheme": scheme.name if scheme else "",
+            }
+            charges.append(scheme.monthly_charge if scheme else 0)
+
+        self.user_ids = list(self.members)
+
+        if np is not None:
+            self._compute_numpy(charges)
+        else:
+            self._compute_bitsets(charges)
+
+    def pending_masks(self):
+        """(column offset, [(user_id, mask), ...]) per slice of the window."""
+        for start in range(0, self.months, MASK_MONTHS):
+            first = self.first + start
+            last = min(first + MASK_MONTHS, self.last + 1)
+            masks = (
+                MonthlyCharge.objects.filter(
+                    PENDING_CHARGE,
+                    charge_month__gte=_month_date(first),
+                    charge_month__lt=_month_date(last),
+                )
+                .values("user_id")
+                .annotate(mask=Sum(_Bit(_month_expression("charge_month") - first)))
+                .values_list("user_id", "mask")
+                .order_by()
+            )
+            yield start, last - first, list(masks)
+
+    def _compute_numpy(self, charges):
+        user_ids = np.array(self.user_ids, dtype=np.int64)
+        owed = np.zeros((len(user_ids), self.months), dtype=bool)
+
+        for start, width, masks in self.pending_masks():
+            if not masks or not len(user_ids):
+                continue
+            masks = np.array(masks, dtype=np.int64)
+            rows = np.searchsorted(user_ids, masks[:, 0])
+            known = rows < len(user_ids)
+            known[known] = user_ids[rows[known]] == masks[known, 0]
+            bits = (masks[known, 1:2] >> np.arange(width)) & 1
+            owed[rows[known], start:start + width] = bits.astype(bool)
+
+        # Longest streak: a running count of owed months that restarts at
+        # every month not owed. int16 keeps the 2D temporaries small.
+        running = np.cumsum(owed, axis=1, dtype=np.int16)
+        restart = np.maximum.accumulate(np.where(owed, 0, running), axis=1)
+        pending = running[:, -1] if self.months else np.zeros(len(user_ids), dtype=np.int16)
+
+        self.pending = pending.tolist()
+        self.longest_streak = (running - restart).max(axis=1, initial=0).tolist()
+        self.owed = (pending * np.array(charges, dtype=np.int64)).tolist()
+
+    def _compute_bitsets(self, charges):
+        index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+        bitsets = [0] * len(self.user_ids)
+        for start, width, masks in self.pending_masks():
+            for user_id, mask in masks:
+                i = index.get(user_id)
+                if i is not None:
+                    bitsets[i] |= mask << start
+
+        self.pending, self.longest_streak, self.owed = [], [], []
+        for owed, charge in zip(bitsets, charges):
+            pending = owed.bit_count()
+            self.pending.append(pending)
+            self.longest_streak.append(_longest_run(owed))
+            self.owed.append(pending * charge)
+
+    def rows(self, in_arrears_only=True):
+        """One dict per member, largest amount owed first."""
+        order = sorted(range(len(self.user_ids)), key=lambda i: (-self.owed[i], -self.pending[i]))
+        for i in order:
+            if in_arrears_only and not self.pending[i]:
+                continue
+            yield {
+                **self.members[self.user_ids[i]],
+                "pending": self.pending[i],
+                "longest_streak": self.longest_streak[i],
+                "owed": self.owed[i],
+            }
+
+    def scheme_totals(self):
+        """Members in arrears, months pending and amount owed per scheme."""
+        totals = {}
+        for i, user_id in enumerate(self.user_ids):
+            if not self.pending[i]:
+                continue
+            scheme = totals.setdefault(
+                self.members[user_id]["scheme"] or "No scheme",
+                {"members": 0, "pending": 0, "owed": 0},
+            )
+            scheme["members"] += 1
+            scheme["pending"] += self.pending[i]
+            scheme["owed"] += self.owed[i]
+        return dict(sorted(totals.items()))
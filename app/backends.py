@@ -1,24 +1,71 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.crypto import salted_hmac
 
 User = get_user_model()
 
+
+def _failure_key(identifier, password):
+    # Keyed on the pair, so a wrong guess never locks out the right password,
+    # and hashed so neither ends up in the cache in clear
+    digest = salted_hmac("login-failure", f"{identifier}\0{password}").hexdigest()
+    return f"login:failure:{digest}"
+
+
+def forget_login_failures(user, password):
+    """
+    Drop the remembered failures of `password` for `user`'s username and
+    email, so a password that was just set works at once even if it was
+    tried (and failed) shortly before.
+    """
+    identifiers = {user.username.strip().lower(), (user.email or "").strip().lower()} - {""}
+    cache.delete_many([_failure_key(identifier, password) for identifier in identifiers])
+
+
 class EmailOrUsernameBackend(ModelBackend):
+    """
+    Log in by username or email, case-insensitively, in a single query.
+
+    Both lookups go through lower() expression indexes on auth_user. Unknown
+    identifiers still pay for one password hash so they take as long as a
+    wrong password, and a failing identifier/password pair is remembered for
+    settings.LOGIN_FAILURE_CACHE_TIMEOUT seconds so a repeated attempt costs
+    neither a query nor a hash.
+    """
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None:
             username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+
+        identifier = username.strip().lower()
+        failure_key = _failure_key(identifier, password)
+        if cache.get(failure_key):
+            return None
 
-        try:
-            # Try to find user by username
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            # If not found, try email
-            try:
-                user = User.objects.get(email=username)
-            except User.DoesNotExist:
-                return None
-
-        if user.check_password(password):
+        user = self.find_user(identifier)
+        if user is None:
+            # Run the hasher anyway so unknown users are not faster to reject
+            User().set_password(password)
+        elif user.check_password(password) and self.user_can_authenticate(user):
             return user
-        
+
+        cache.set(failure_key, True, settings.LOGIN_FAILURE_CACHE_TIMEOUT)
         return None
+
+    def find_user(self, identifier):
+        """The user whose username, or else only email, matches `identifier`."""
+        users = list(
+            User.objects.alias(username_lower=Lower("username"), email_lower=Lower("email"))
+            .filter(Q(username_lower=identifier) | Q(email_lower=identifier))
+        )
+        for user in users:
+            if user.username.lower() == identifier:
+                return user
+        # An email shared by several accounts does not say which one is meant
+        return users[0] if len(users) == 1 else None
@@ -0,0 +1,186 @@
+import hashlib
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+# --------------------------
+# Per-member page cache
+# --------------------------
+# Each member has a version token, and so does the scheme table. Cached
+# page contexts are keyed by both, so invalidating a member (or every
+# member, for a scheme change) is a single write of a fresh token; old
+# entries are never read again and simply age out.
+
+SCHEME_VERSION_KEY = "member_page:scheme_version"
+HITS_KEY = "member_page:hits"
+MISSES_KEY = "member_page:misses"
+
+
+def _member_version_key(user_id):
+    return f"member_page:version:{user_id}"
+
+
+def _version(key):
+    version = cache.get(key)
+    if version is None:
+        # A fresh token can never collide with entries cached under an
+        # evicted one
+        version = uuid.uuid4().hex
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def _count(key):
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def member_page_context(request, page, build, enabled=True):
+    """
+    Return the template context of `page` for the logged-in member,
+    calling `build()` only on a cache miss.
+
+    Pages listed in settings.MEMBER_PAGE_CACHE_DISABLED, or called with
+    enabled=False, always build fresh. The query string is part of the
+    key, so each page of a paginated history is cached on its own.
+    """
+    if not enabled or page in settings.MEMBER_PAGE_CACHE_DISABLED:
+        return build()
+
+    query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    key = ":".join([
+        "member_page",
+        str(request.user.pk),
+        page,
+        _version(_member_version_key(request.user.pk)),
+        _version(SCHEME_VERSION_KEY),
+        query,
+    ])
+
+    context = cache.get(key)
+    if context is not None:
+        _count(HITS_KEY)
+        return context
+
+    _count(MISSES_KEY)
+    context = build()
+    cache.set(key, context, settings.MEMBER_PAGE_CACHE_TIMEOUT)
+    return context
+
+
+def invalidate_member_pages(user_ids):
+    """Drop the cached pages of `user_ids` once the current transaction commits."""
+    user_ids = set(user_ids)
+    if not user_ids:
+        return
+
+    def bump():
+        cache.set_many(
+            {_member_version_key(user_id): uuid.uuid4().hex for user_id in user_ids},
+            timeout=None,
+        )
+
+    transaction.on_commit(bump)
+
+
+def invalidate_all_member_pages():
+    """Drop every member's cached pages and reload the scheme catalog."""
+    transaction.on_commit(
+        lambda: cache.set(SCHEME_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    )
+
+
+def cache_is_shared():
+    """
+    Whether the default cache is seen by every process. The hit and miss
+    counters live in it, so with a per-process backend they only cover the
+    process that reads them.
+    """
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+def member_page_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+        "shared": cache_is_shared(),
+    }
+
+
+def reset_member_page_stats():
+    cache.set_many({HITS_KEY: 0, MISSES_KEY: 0}, timeout=None)
+
+
+# --------------------------
+# Scheme catalog
+# --------------------------
+# Schemes are few and rarely edited, so every process keeps all of them in
+# memory. The catalog is reloaded from the database when:
+#   - a lookup asks for a scheme id it does not hold (a scheme created by
+#     another process),
+#   - it is older than settings.SCHEME_CATALOG_MAX_AGE seconds (an edit
+#     made by another process), or
+#   - the scheme version token changes (an edit made through this cache).
+# The token alone is not enough across processes with a per-process cache
+# backend such as locmem, so nothing served to clients is keyed on it: the
+# catalog's ETag is a hash of the schemes it actually holds, the same in
+# every process that loaded the same rows.
+
+_catalog = {"version": None, "loaded_at": None, "schemes": {}, "etag": None}
+
+
+def _load_catalog(version):
+    from app.models import Scheme
+
+    schemes = {scheme.id: scheme for scheme in Scheme.objects.order_by("id")}
+    digest = hashlib.md5()
+    for scheme in schemes.values():
+        digest.update(repr([
+            getattr(scheme, field.attname) for field in Scheme._meta.concrete_fields
+        ]).encode())
+    _catalog.update(
+        version=version, loaded_at=time.monotonic(), schemes=schemes, etag=digest.hexdigest()
+    )
+
+
+def scheme_catalog(require=()):
+    """
+    All schemes keyed by id. Scheme ids in `require` that the catalog does
+    not hold trigger one reload; ids still missing after it do not exist.
+    """
+    version = _version(SCHEME_VERSION_KEY)
+    stale = (
+        _catalog["version"] != version
+        or _catalog["loaded_at"] is None
+        or time.monotonic() - _catalog["loaded_at"] > settings.SCHEME_CATALOG_MAX_AGE
+        or any(scheme_id not in _catalog["schemes"] for scheme_id in require)
+    )
+    if stale:
+        _load_catalog(version)
+    return _catalog["schemes"]
+
+
+def get_scheme(scheme_id):
+    if scheme_id is None:
+        return None
+    return scheme_catalog(require=(scheme_id,)).get(scheme_id)
+
+
+def scheme_catalog_etag():
+    """ETag of the catalog as loaded: changes exactly when its contents do."""
+    scheme_catalog()
+    return _catalog["etag"]
@@ -0,0 +1,47 @@
+import time
+import uuid
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.querybudget import QueryLog
+
+
+class Command(BaseCommand):
+    help = "Time authenticate() for successful, failing and unknown logins on a scratch user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--attempts", type=int, default=20, help="Attempts per scenario")
+
+    def handle(self, *args, **options):
+        attempts = options["attempts"]
+        email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        password = uuid.uuid4().hex
+
+        scenarios = {
+            "valid login": lambda i: (email, password),
+            "valid login, upper-case email": lambda i: (email.upper(), password),
+            "wrong password": lambda i: (email, f"wrong-{i}"),
+            "unknown user": lambda i: (f"nobody-{i}@example.com", password),
+            "repeated failure": lambda i: (email, "wrong"),
+        }
+
+        self.stdout.write(f"{'scenario':<32} {'ms/attempt':>10} {'queries/attempt':>16}")
+        with transaction.atomic():
+            User.objects.create_user(username=email, email=email, password=password)
+
+            for name, credentials in scenarios.items():
+                started = time.perf_counter()
+                with QueryLog() as log:
+                    for i in range(attempts):
+                        username, attempt_password = credentials(i)
+                        authenticate(username=username, password=attempt_password)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{name:<32} {elapsed / attempts * 1000:>10.2f} "
+                    f"{log.count / attempts:>16.2f}"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.member_ids import BLOCK_SIZE, ID_SPACE, MemberIdAllocator
+from app.models import MemberIdSequence
+from app.querybudget import QueryLog
+
+BENCHMARK_SEQUENCE = "benchmark"
+
+
+class Command(BaseCommand):
+    help = "Time member id allocation in steps up to --count ids, on a scratch sequence"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1_000_000)
+        parser.add_argument("--step", type=int, default=100_000)
+        parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+
+    def handle(self, *args, **options):
+        count, step = options["count"], options["step"]
+        if not 0 < step <= count <= ID_SPACE:
+            raise CommandError(f"Need 0 < --step <= --count <= {ID_SPACE}")
+
+        allocator = MemberIdAllocator(BENCHMARK_SEQUENCE, options["block_size"])
+        MemberIdSequence.objects.filter(name=BENCHMARK_SEQUENCE).delete()
+        seen = set()
+
+        self.stdout.write(f"{'allocated':>10} {'seconds':>8} {'us/id':>8} {'queries':>8}")
+        try:
+            with QueryLog() as log:
+                while len(seen) < count:
+                    log.queries.clear()
+                    n = min(step, count - len(seen))
+                    started = time.perf_counter()
+                    for _ in range(n):
+                        seen.add(allocator.allocate()[0])
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(
+                        f"{len(seen):>10} {elapsed:>8.2f} "
+                        f"{elapsed / n * 1e6:>8.2f} {log.count:>8}"
+                    )
+        finally:
+            MemberIdSequence.objects.filter(name=BENCHMARK_SEQUENCE).delete()
+
+        self.stdout.write(self.style.SUCCESS(f"{len(seen)} distinct ids allocated"))
@@ -0,0 +1,153 @@
+import json
+import re
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, get_resolver
+
+from app.models import MonthlyCharge, UserProfile
+from app.querybudget import QueryLog
+
+DEFAULT_BASELINE = "bench_baseline.json"
+PARAMETER = re.compile(r"<(?:\w+:)?(\w+)>")
+
+
+def routes():
+    """(route, pattern) for every plain path in the root URLconf; includes are skipped."""
+    for pattern in get_resolver(settings.ROOT_URLCONF).url_patterns:
+        if isinstance(pattern, URLPattern):
+            yield str(pattern.pattern), pattern
+
+
+class Command(BaseCommand):
+    help = (
+        "GET every route in core/urls.py through the test client and record time, "
+        "queries and peak memory; compare against or write a JSON baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+        parser.add_argument(
+            "--write-baseline", action="store_true",
+            help="Save this run as the new baseline instead of comparing",
+        )
+        parser.add_argument(
+            "--threshold", type=float, default=0.25,
+            help="Allowed relative regression in time and memory (default: 0.25)",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="Requests per route; the median time is kept")
+
+    def handle(self, *args, **options):
+        admin = User.objects.filter(is_superuser=True).first()
+        profile = UserProfile.objects.select_related("user").filter(user__is_superuser=False).first()
+        charge = MonthlyCharge.objects.first()
+        if admin is None or profile is None or charge is None:
+            raise CommandError("Needs a superuser, a member and a charge; run seedbench first")
+
+        parameters = {
+            "user_id": profile.user_id,
+            "member_id": profile.member_id,
+            "charge_id": charge.id,
+        }
+
+        setup_test_environment()
+        tracemalloc.start()
+        try:
+            results = self.run_routes(admin, profile.user, parameters, options["repeat"])
+        finally:
+            tracemalloc.stop()
+            teardown_test_environment()
+
+        if options["write_baseline"]:
+            with open(options["baseline"], "w") as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+
+        try:
+            with open(options["baseline"]) as baseline:
+                baseline = json.load(baseline)
+        except FileNotFoundError:
+            self.stdout.write(f"No baseline at {options['baseline']}; rerun with --write-baseline")
+            return
+
+        regressions = self.compare(results, baseline, options["threshold"])
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    def run_routes(self, admin, member, parameters, repeat):
+        clients = {"admin": Client(), "member": Client(), "anonymous": Client()}
+        clients["admin"].force_login(admin)
+        clients["member"].force_login(member)
+
+        results = {}
+        self.stdout.write(f"{'route':<48} {'status':>6} {'ms':>9} {'queries':>8} {'peak KiB':>9}")
+        for route, pattern in routes():
+            names = PARAMETER.findall(route)
+            if any(name not in parameters for name in names):
+                self.stdout.write(f"{route:<48} skipped (no sample value for its parameters)")
+                continue
+            path = "/" + PARAMETER.sub(lambda m: str(parameters[m.group(1)]), route)
+
+            if route == "":
+                client = clients["anonymous"]
+            elif route.startswith("user-"):
+                client = clients["member"]
+            else:
+                client = clients["admin"]
+
+            timings, counts, peaks = [], [], []
+            # The first request is a warm-up: imports, template loading
+            for attempt in range(repeat + 1):
+                tracemalloc.reset_peak()
+                held = tracemalloc.get_traced_memory()[0]
+                started = time.perf_counter()
+                # Some routes write (mark paid, monthly run); undo them so
+                # every repeat, and the next run, sees the same data
+                with transaction.atomic(), QueryLog() as log:
+                    response = client.get(path)
+                    if response.streaming:
+                        b"".join(response.streaming_content)
+                    transaction.set_rollback(True)
+                if attempt == 0:
+                    continue
+                timings.append(time.perf_counter() - started)
+                counts.append(log.count)
+                peaks.append(tracemalloc.get_traced_memory()[1] - held)
+
+            result = {
+                "status": response.status_code,
+                "ms": round(statistics.median(timings) * 1000, 2),
+                "queries": max(counts),
+                "peak_kib": round(max(peaks) / 1024, 1),
+            }
+            results["/" + route] = result
+            self.stdout.write(
+                f"{path:<48} {result['status']:>6} {result['ms']:>9.2f} "
+                f"{result['queries']:>8} {result['peak_kib']:>9.1f}"
+            )
+        return results
+
+    def compare(self, results, baseline, threshold):
+        regressions = []
+        for route, result in results.items():
+            before = baseline.get(route)
+            if before is None:
+                continue
+            if result["queries"] > before["queries"]:
+                regressions.append(f"{route}: {before['queries']} -> {result['queries']} queries")
+            for key, unit in (("ms", "ms"), ("peak_kib", "KiB")):
+                if result[key] > before[key] * (1 + threshold):
+                    regressions.append(f"{route}: {before[key]} -> {result[key]} {unit}")
+        return regressions
+
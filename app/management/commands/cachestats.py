@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from app.cache import member_page_stats, reset_member_page_stats
+
+class Command(BaseCommand):
+    help = (
+        "Show hit/miss counts of the per-member page cache. The counters live in the "
+        "default cache, so they only cover every worker with a shared backend "
+        "(not LocMemCache)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Zero the counters afterwards")
+
+    def handle(self, *args, **options):
+        stats = member_page_stats()
+        if not stats["shared"]:
+            self.stderr.write(self.style.WARNING(
+                "The default cache is per process, so these counters are this command's "
+                "own (always 0/0); configure a shared cache backend to see the workers'"
+            ))
+        self.stdout.write(
+            "Member page cache: {hits} hits, {misses} misses ({hit_ratio:.1%} hit ratio)".format(**stats)
+        )
+        if options["reset"]:
+            reset_member_page_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
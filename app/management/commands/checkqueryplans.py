@@ -0,0 +1,157 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from app.models import (
+    EmailToken,
+    MemberLedgerSummary,
+    MonthlyCharge,
+    MonthlyReward,
+    SchemeMonthlyRollup,
+)
+from app.utils import current_month, keyset_query, last_reward_months, member_summaries
+
+# A bare "SCAN <table>" is a full table scan; "SCAN ... USING INDEX" and
+# "SEARCH ..." are fine.
+FULL_SCAN = re.compile(r"\bSCAN (\w+)$")
+# A keyset page must read its rows in index order; sorting them means
+# sorting everything before the cursor, on every page.
+SORT = re.compile(r"\bUSE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY$")
+
+# Pages over all members walk the profiles in id order by design; what they
+# must not do is scan the tables joined to each profile.
+EXPECTED_SCANS = {
+    "member summaries: a page": {"app_userprofile"},
+    "last reward months: a page": {"app_userprofile"},
+}
+
+
+def key_queries():
+    """The ledger lookups behind the hot views, by name."""
+    month = current_month()
+    user_id = 1
+
+    return {
+        "monthly run: charges billed this month":
+            MonthlyCharge.objects.filter(charge_month=month).values_list("user_id", "paid"),
+        "monthly run: rewards given this month":
+            MonthlyReward.objects.filter(reward_month=month).values_list("user_id"),
+        "quick_mark_paid: charge for user and month":
+            MonthlyCharge.objects.filter(user_id=user_id, charge_month=month),
+        "quick_mark_paid: reward for user and month":
+            MonthlyReward.objects.filter(user_id=user_id, reward_month=month),
+        "user admin: paid this month":
+            MonthlyCharge.objects.filter(user_id=user_id, paid=True, charge_month=month),
+        "user_charges: history of a user":
+            MonthlyCharge.objects.filter(user_id=user_id).order_by("-charge_month"),
+        "user_rewards: history of a user":
+            MonthlyReward.objects.filter(user_id=user_id).order_by("-reward_month"),
+        "admin_charges: unpaid charges of a month":
+            MonthlyCharge.objects.filter(charge_month=month, paid=False),
+        "ledger summary: one member":
+            MemberLedgerSummary.objects.filter(user_id=user_id),
+        "ledger summary: grouped charges":
+            MonthlyCharge.objects.filter(user_id__in=[1, 2, 3]).values("user_id").order_by(),
+        "email tokens: expired":
+            EmailToken.objects.filter(expiry__lt=timezone.now()),
+        "member summaries: a page":
+            member_summaries().order_by("id")[:50],
+        "member summaries: one member":
+            member_summaries().filter(member_id="JR0001"),
+        "last reward months: a page":
+            last_reward_months().order_by("id")[:50],
+        "dashboard: rollup totals of a month":
+            SchemeMonthlyRollup.objects.filter(month__in=[month]).values("month").order_by(),
+        "rollup report: a range of months":
+            SchemeMonthlyRollup.objects.filter(month__gte=month, month__lte=month),
+    }
+
+
+def keyset_queries():
+    """The page queries of the keyset-paginated listings, by name."""
+    month = current_month()
+    user_id = 1
+    listings = {
+        "user_charges": (MonthlyCharge.objects.filter(user_id=user_id), "charge_month"),
+        "user_rewards": (MonthlyReward.objects.filter(user_id=user_id), "reward_month"),
+        "admin_charges": (
+            MonthlyCharge.objects.select_related("user__userprofile__scheme"), "charge_month"
+        ),
+        "admin_charges of a month": (
+            MonthlyCharge.objects.select_related("user__userprofile__scheme")
+            .filter(charge_month=month),
+            "charge_month",
+        ),
+        "admin_rewards": (
+            MonthlyReward.objects.select_related("user__userprofile__scheme"), "reward_month"
+        ),
+    }
+    positions = {
+        "first page": None,
+        "next page": ("next", month, 1),
+        "previous page": ("prev", month, 1),
+    }
+
+    return {
+        f"{listing}: {page}": keyset_query(queryset, month_field, position)
+        for listing, (queryset, month_field) in listings.items()
+        for page, position in positions.items()
+    }
+
+
+def checked_queries():
+    """(name, queryset, ordered) for every query the plan check covers."""
+    queries = [(name, queryset, False) for name, queryset in key_queries().items()]
+    queries += [(name, queryset, True) for name, queryset in keyset_queries().items()]
+    return queries
+
+
+def plan_problems(name, queryset, ordered=False):
+    """
+    EXPLAIN `queryset` and return (plan, full scans, sorts): the tables it
+    scans that EXPECTED_SCANS does not allow for `name`, and, when `ordered`,
+    whether it sorts its rows.
+    """
+    plan = queryset.explain()
+    lines = [line.strip() for line in plan.splitlines()]
+    scans = [
+        match.group(1)
+        for line in lines
+        if (match := FULL_SCAN.search(line))
+        and match.group(1) not in EXPECTED_SCANS.get(name, ())
+    ]
+    sorts = ordered and any(SORT.search(line) for line in lines)
+    return plan, scans, sorts
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the key ledger queries on SQLite and fail on any full table scan, "
+        "or on a keyset page that sorts"
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("checkqueryplans only understands SQLite query plans")
+
+        failures = []
+        for name, queryset, ordered in checked_queries():
+            plan, scans, sorts = plan_problems(name, queryset, ordered)
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"FULL SCAN  {name}: {', '.join(scans)}"))
+                self.stdout.write(plan)
+            elif sorts:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"SORT       {name}"))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(f"ok         {name}")
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} key queries fall back to a full table scan or a sort"
+            )
+        self.stdout.write(self.style.SUCCESS("All key queries use an index"))
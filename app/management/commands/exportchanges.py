@@ -0,0 +1,60 @@
+import gzip
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.utils import delta_watermark, ledger_change_lines, ledger_changes, parse_watermark
+
+
+class Command(BaseCommand):
+    help = "Export charges and rewards changed since a watermark as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Watermark from the previous export (default: everything)")
+        parser.add_argument(
+            "--state",
+            help="File holding the watermark: read as --since, rewritten after a successful export",
+        )
+        parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+
+    def handle(self, *args, **options):
+        since = options["since"]
+        if since is None and options["state"]:
+            try:
+                with open(options["state"]) as state:
+                    since = state.read().strip()
+            except FileNotFoundError:
+                since = None
+
+        try:
+            since = parse_watermark(since)
+        except ValueError:
+            raise CommandError(f"Not a watermark: {since!r}")
+
+        until = delta_watermark()
+        lines = ledger_change_lines(ledger_changes(since, until), options["format"])
+
+        target = options["output"] or sys.stdout.buffer
+        if options["gzip"]:
+            output = gzip.open(target, "wt", encoding="utf-8", newline="")
+        elif options["output"]:
+            output = open(target, "w", encoding="utf-8", newline="")
+        else:
+            output = sys.stdout
+
+        count = 0
+        try:
+            for line in lines:
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        if options["state"]:
+            with open(options["state"], "w") as state:
+                state.write(until.isoformat())
+
+        self.stderr.write(f"{count} lines exported; next watermark {until.isoformat()}")
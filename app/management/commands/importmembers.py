@@ -0,0 +1,44 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from app.utils import onboard_members
+
+class Command(BaseCommand):
+    help = "Bulk-create members from a CSV of email, first_name, last_name, scheme"
+
+    def add_arguments(self, parser):
+        parser.add_argument("members", help="Path to the members CSV")
+        parser.add_argument(
+            "--password", default=None,
+            help="Initial password for every member (default: unusable, set via setup mail)",
+        )
+        parser.add_argument(
+            "--rejects", default=None,
+            help="Where to write rejected rows (default: <members>.rejects.csv)",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rejects_path = options["rejects"] or f"{options['members']}.rejects.csv"
+        started = time.monotonic()
+
+        try:
+            with open(options["members"], newline="", encoding="utf-8-sig") as members, \
+                    open(rejects_path, "w", newline="", encoding="utf-8") as rejects_file:
+                totals = onboard_members(
+                    members,
+                    password=options["password"],
+                    batch_size=options["batch_size"],
+                    rejects=csv.writer(rejects_file),
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {created} members in {seconds:.2f}s, {rejected} rejected".format(
+                seconds=time.monotonic() - started, **totals
+            )
+        ))
+        if totals["rejected"]:
+            self.stdout.write(f"Rejected rows written to {rejects_path}")
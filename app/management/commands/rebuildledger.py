@@ -0,0 +1,26 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from app.utils import ledger_summary_drift, refresh_ledger_summaries
+
+class Command(BaseCommand):
+    help = "Rebuild member ledger summaries from MonthlyCharge/MonthlyReward, or check them for drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report members whose summary differs from the ledger",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            drifted = list(ledger_summary_drift())
+            if drifted:
+                raise CommandError(
+                    f"{len(drifted)} ledger summaries drifted, e.g. user ids {drifted[:10]}"
+                )
+            self.stdout.write(self.style.SUCCESS("Ledger summaries match the ledger"))
+            return
+
+        user_ids = list(User.objects.values_list("id", flat=True))
+        refresh_ledger_summaries(user_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ledger summaries for {len(user_ids)} members"))
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import SchemeMonthlyRollup
+from app.utils import refresh_scheme_rollups
+
+
+class Command(BaseCommand):
+    help = "Recount the per-scheme monthly rollup from MonthlyCharge"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Only recount YYYY-MM (default: every month)")
+
+    def handle(self, *args, **options):
+        months = None
+        if options["month"]:
+            try:
+                months = [datetime.strptime(options["month"], "%Y-%m").date()]
+            except ValueError:
+                raise CommandError("--month must look like YYYY-MM")
+
+        refresh_scheme_rollups(months)
+        cells = SchemeMonthlyRollup.objects.all()
+        if months:
+            cells = cells.filter(month__in=months)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {cells.count()} scheme/month rollup cells"))
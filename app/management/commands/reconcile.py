@@ -0,0 +1,39 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from app.utils import reconcile_statement
+
+class Command(BaseCommand):
+    help = "Mark payments from a bank statement CSV (member_id, month, amount) as paid"
+
+    def add_arguments(self, parser):
+        parser.add_argument("statement", help="Path to the statement CSV")
+        parser.add_argument(
+            "--rejects", default=None,
+            help="Where to write unmatched lines (default: <statement>.rejects.csv)",
+        )
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        rejects_path = options["rejects"] or f"{options['statement']}.rejects.csv"
+        started = time.monotonic()
+
+        try:
+            with open(options["statement"], newline="", encoding="utf-8-sig") as statement, \
+                    open(rejects_path, "w", newline="", encoding="utf-8") as rejects_file:
+                totals = reconcile_statement(
+                    statement, csv.writer(rejects_file), batch_size=options["batch_size"]
+                )
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            "Reconciled {lines} lines in {seconds:.2f}s: {created} charges created, "
+            "{updated} marked paid, {skipped} skipped (already paid), "
+            "{rejected} rejected".format(
+                seconds=time.monotonic() - started, **totals
+            )
+        ))
+        if totals["rejected"]:
+            self.stdout.write(f"Rejected lines written to {rejects_path}")
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.utils import (
+    BULK_BATCH_SIZE,
+    MONTHLY_JOB_SHARD_SIZE,
+    JobTakenOver,
+    claim_monthly_job,
+    run_monthly_job,
+)
+
+
+class Command(BaseCommand):
+    help = "Run monthly jobs queued from the admin dashboard, shard by shard"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shard-size", type=int, default=MONTHLY_JOB_SHARD_SIZE)
+        parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep polling for new jobs instead of exiting once the queue is empty",
+        )
+        parser.add_argument("--interval", type=float, default=2.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_monthly_job()
+            if job is None:
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+                continue
+
+            self.stdout.write(f"Job #{job.id}: billing {job.month:%Y-%m}")
+            started = time.monotonic()
+            try:
+                run_monthly_job(job, shard_size=options["shard_size"], batch_size=options["batch_size"])
+            except JobTakenOver as exc:
+                self.stderr.write(self.style.WARNING(f"{exc}; leaving it"))
+                continue
+            except Exception as exc:
+                self.stderr.write(self.style.ERROR(f"Job #{job.id} failed: {exc!r}"))
+                continue
+
+            self.stdout.write(self.style.SUCCESS(
+                f"Job #{job.id} done: {job.members_done} members in {job.shards_done} shards, "
+                f"{job.inserted} inserted, {job.skipped} skipped "
+                f"in {time.monotonic() - started:.2f}s"
+            ))
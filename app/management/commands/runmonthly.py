@@ -1,9 +1,111 @@
-from django.core.management.base import BaseCommand
-from app.utils import generate_monthly_entries
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import time
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from app.models import MonthlyRunShard
+from app.utils import current_month, plan_shards, run_monthly_shard
+
+
+def _init_worker():
+    # Forked workers must not share the parent's database connection
+    django.setup()
+    connections.close_all()
+
+
+def _run_shard(month, start_id, end_id, batch_size):
+    try:
+        return run_monthly_shard(month, start_id, end_id, batch_size=batch_size)
+    finally:
+        connections.close_all()
+
+
+DEFAULT_SHARD_SIZE = 5000
+
 
 class Command(BaseCommand):
     help = "Generate monthly charges and rewards"
 
-    def handle(self, *args, **kwargs):
-        generate_monthly_entries()
-        self.stdout.write(self.style.SUCCESS("Monthly entries generated successfully"))
+    def add_arguments(self, parser):
+        parser.add_argument("--month", help="Month to bill as YYYY-MM (default: current month)")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers", type=int, default=0,
+            help="Process shards in a pool of N processes (default: one after another)",
+        )
+        parser.add_argument(
+            "--shard-size", type=int,
+            help=f"Member ids per shard (default: {DEFAULT_SHARD_SIZE})",
+        )
+        parser.add_argument(
+            "--resume", action="store_true",
+            help="Skip shards already checkpointed for this month",
+        )
+
+    def handle(self, *args, **options):
+        month = None
+        if options["month"]:
+            try:
+                month = datetime.strptime(options["month"], "%Y-%m").date()
+            except ValueError:
+                raise CommandError("--month must look like YYYY-MM")
+
+        # Always in shards: one transaction over every member could outlast
+        # the delta export's lag (see app.utils.ledger_transaction)
+        self.run_sharded(month or current_month(), options)
+
+    def run_sharded(self, month, options):
+        shard_size = options["shard_size"] or DEFAULT_SHARD_SIZE
+        if shard_size < 1:
+            raise CommandError("--shard-size must be positive")
+
+        shards = plan_shards(shard_size)
+        if options["resume"]:
+            done = set(
+                MonthlyRunShard.objects.filter(month=month)
+                .values_list("start_id", "end_id")
+            )
+            pending = [s for s in shards if s not in done]
+            self.stdout.write(f"Resuming: {len(shards) - len(pending)} of {len(shards)} shards already done")
+            shards = pending
+
+        started = time.monotonic()
+        results = []
+        workers = max(options["workers"], 1)
+
+        if workers == 1:
+            for start_id, end_id in shards:
+                results.append(run_monthly_shard(
+                    month, start_id, end_id, batch_size=options["batch_size"]
+                ))
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = [
+                    pool.submit(_run_shard, month, start_id, end_id, options["batch_size"])
+                    for start_id, end_id in shards
+                ]
+                for future in as_completed(futures):
+                    results.append(future.result())
+
+        self.write_summary(month, results, time.monotonic() - started)
+
+    def write_summary(self, month, results, elapsed):
+        results.sort(key=lambda r: r["start_id"])
+        self.stdout.write(f"{'shard':>24} {'charges':>8} {'rewards':>8} {'skipped':>8} {'seconds':>8}")
+        for r in results:
+            shard = f"[{r['start_id']}, {r['end_id']})"
+            self.stdout.write(
+                f"{shard:>24} {r['charges']:>8} {r['rewards']:>8} "
+                f"{r['skipped']:>8} {r['duration']:>8.2f}"
+            )
+
+        inserted = sum(r["inserted"] for r in results)
+        skipped = sum(r["skipped"] for r in results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Monthly entries generated for {month:%Y-%m}: {len(results)} shards, "
+            f"{inserted} inserted, {skipped} skipped in {elapsed:.2f}s"
+        ))
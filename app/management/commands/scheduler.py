@@ -0,0 +1,63 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from app.scheduler import LeaseLost, make_owner, release_lease, scheduled_at, tick
+
+
+class Command(BaseCommand):
+    help = (
+        "Run monthly billing on MONTHLY_RUN_DAY at MONTHLY_RUN_TIME (TIME_ZONE), "
+        "catching up missed months; safe to start on several hosts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=30.0,
+            help="Seconds between checks; keep it well under SCHEDULER_LEASE_SECONDS",
+        )
+        parser.add_argument("--once", action="store_true", help="Check once and exit")
+        parser.add_argument("--shard-size", type=int)
+
+    def handle(self, *args, **options):
+        if options["interval"] >= settings.SCHEDULER_LEASE_SECONDS:
+            raise CommandError("--interval must be shorter than SCHEDULER_LEASE_SECONDS")
+        if not 1 <= settings.MONTHLY_RUN_DAY <= 28:
+            raise CommandError("MONTHLY_RUN_DAY must be between 1 and 28")
+
+        owner = make_owner()
+        self.stdout.write(f"Scheduler {owner} started")
+        holding = False
+        try:
+            while True:
+                try:
+                    runs = tick(owner, shard_size=options["shard_size"])
+                except LeaseLost as exc:
+                    self.stderr.write(self.style.WARNING(str(exc)))
+                    runs = None
+
+                if (runs is not None) != holding:
+                    holding = runs is not None
+                    self.stdout.write("Holding the lease" if holding else "Waiting for the lease")
+                for run in runs or []:
+                    self.report(run)
+
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            release_lease(owner)
+
+    def report(self, run):
+        line = (
+            f"{run.month:%Y-%m} (due {scheduled_at(run.month):%Y-%m-%d %H:%M}"
+            f"{', caught up' if run.catch_up else ''}): {run.status}, "
+            f"{run.inserted} inserted in {run.duration:.2f}s"
+        )
+        if run.status == run.DONE:
+            self.stdout.write(self.style.SUCCESS(line))
+        else:
+            self.stderr.write(self.style.ERROR(f"{line}: {run.error}"))
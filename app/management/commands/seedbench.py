@@ -0,0 +1,129 @@
+import random
+import time
+import uuid
+from datetime import datetime
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from app.member_ids import allocate_member_ids
+from app.models import MonthlyCharge, MonthlyReward, Scheme, UserProfile
+from app.utils import (
+    BULK_BATCH_SIZE,
+    current_month,
+    refresh_ledger_summaries,
+    refresh_scheme_rollups,
+)
+
+BENCH_PASSWORD = "bench"
+DEFAULT_SCHEMES = [
+    ("Bench Silver", 12000, 1000, "Silver monthly gift"),
+    ("Bench Gold", 24000, 2000, "Gold monthly gift"),
+    ("Bench Platinum", 60000, 5000, "Platinum monthly gift"),
+]
+
+
+def months_back(month, count):
+    """`count` first-of-month dates ending with `month`, oldest first."""
+    months = []
+    year, number = month.year, month.month
+    for _ in range(count):
+        months.append(month.replace(year=year, month=number))
+        number -= 1
+        if number == 0:
+            year, number = year - 1, 12
+    return months[::-1]
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic members with charge and reward history for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=1000)
+        parser.add_argument("--months", type=int, default=12, help="Months of history per member")
+        parser.add_argument(
+            "--paid-ratio", type=float, default=0.8,
+            help="Share of past charges that are paid (the current month is always unpaid)",
+        )
+        parser.add_argument(
+            "--reward-ratio", type=float, default=1.0,
+            help="Share of paid charges that already have their reward",
+        )
+        parser.add_argument("--seed", type=int, default=None, help="Random seed for repeatable data")
+        parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        members, months = options["members"], options["months"]
+        if members < 1 or months < 1:
+            raise CommandError("--members and --months must be positive")
+        if not (0 <= options["paid_ratio"] <= 1 and 0 <= options["reward_ratio"] <= 1):
+            raise CommandError("--paid-ratio and --reward-ratio must be between 0 and 1")
+
+        rng = random.Random(options["seed"])
+        schemes = list(Scheme.objects.all()) or [
+            Scheme.objects.create(
+                name=name, amount=amount, monthly_charge=charge, monthly_reward_text=reward
+            )
+            for name, amount, charge, reward in DEFAULT_SCHEMES
+        ]
+        history = months_back(current_month(), months)
+        joined = timezone.make_aware(datetime.combine(history[0], datetime.min.time()))
+        password = make_password(BENCH_PASSWORD)
+        run = uuid.uuid4().hex[:8]
+
+        started = time.monotonic()
+        totals = {"members": 0, "charges": 0, "rewards": 0}
+        for offset in range(0, members, options["batch_size"]):
+            count = min(options["batch_size"], members - offset)
+            with transaction.atomic():
+                self.seed_batch(
+                    rng, run, offset, count, schemes, history, joined, password, options, totals
+                )
+            self.stdout.write(f"{offset + count}/{members} members", ending="\r")
+        refresh_scheme_rollups(history)
+
+        self.stdout.write(self.style.SUCCESS(
+            "Seeded {members} members, {charges} charges and {rewards} rewards "
+            "in {seconds:.2f}s (password: {password})".format(
+                seconds=time.monotonic() - started, password=BENCH_PASSWORD, **totals
+            )
+        ))
+
+    def seed_batch(self, rng, run, offset, count, schemes, history, joined, password, options, totals):
+        member_ids = allocate_member_ids(count)
+        users = User.objects.bulk_create([
+            User(
+                username=f"bench-{run}-{offset + i}@example.com",
+                email=f"bench-{run}-{offset + i}@example.com",
+                first_name="Bench",
+                last_name=f"Member {offset + i}",
+                password=password,
+                date_joined=joined,
+            )
+            for i in range(count)
+        ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user, scheme=rng.choice(schemes), member_id=member_id)
+            for user, member_id in zip(users, member_ids)
+        ])
+
+        charges, rewards = [], []
+        reward_text = {scheme.id: scheme.monthly_reward_text for scheme in schemes}
+        for user in users:
+            text = reward_text[user.userprofile.scheme_id]
+            for month in history:
+                paid = month != history[-1] and rng.random() < options["paid_ratio"]
+                charges.append(MonthlyCharge(user=user, charge_month=month, paid=paid))
+                if paid and rng.random() < options["reward_ratio"]:
+                    rewards.append(MonthlyReward(user=user, reward_month=month, reward_text=text))
+
+        MonthlyCharge.objects.bulk_create(charges, batch_size=options["batch_size"])
+        MonthlyReward.objects.bulk_create(rewards, batch_size=options["batch_size"])
+        refresh_ledger_summaries([user.id for user in users])
+
+        totals["members"] += len(users)
+        totals["charges"] += len(charges)
+        totals["rewards"] += len(rewards)
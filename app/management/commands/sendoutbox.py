@@ -0,0 +1,61 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from app.utils import outbox_depth, send_outbox_batch
+
+class Command(BaseCommand):
+    help = "Send queued outbox email in batches over one reused mail connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--max-attempts", type=int, default=5)
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep polling for new mail instead of exiting once the queue is drained",
+        )
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        totals = {"sent": 0, "failed": 0, "retried": 0}
+        latencies = []
+
+        connection = get_connection()
+        connection.open()
+        try:
+            while True:
+                result = send_outbox_batch(
+                    connection,
+                    batch_size=options["batch_size"],
+                    max_attempts=options["max_attempts"],
+                )
+                for key in totals:
+                    totals[key] += result[key]
+                latencies += result["latencies"]
+
+                handled = result["sent"] + result["failed"] + result["retried"]
+                if handled:
+                    self.report(totals, latencies)
+                    continue
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        finally:
+            connection.close()
+
+        self.report(totals, latencies, final=True)
+
+    def report(self, totals, latencies, final=False):
+        latencies = sorted(latencies)
+        if latencies:
+            avg = sum(latencies) / len(latencies) * 1000
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+            latency = f"latency avg {avg:.1f}ms p95 {p95:.1f}ms"
+        else:
+            latency = "no sends"
+
+        line = (
+            f"sent {totals['sent']}, retrying {totals['retried']}, failed {totals['failed']}, "
+            f"queue depth {outbox_depth()}, {latency}"
+        )
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
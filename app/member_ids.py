@@ -0,0 +1,163 @@
+import os
+import threading
+from collections import deque
+
+from django.db import transaction
+
+
+# --------------------------
+# Member id allocator
+# --------------------------
+# Member ids keep the "USR" + 6 hex digit format, but instead of random
+# guesses probed against the table they are a fixed permutation of a
+# counter. The counter lives in MemberIdSequence and each process reserves
+# a block of it with one UPDATE, so handing out an id is an in-memory pop,
+# inside a transaction as well as outside one.
+#
+# The permutation is a 4-round Feistel network over the 24-bit id space:
+# it is a bijection, so distinct counter values can never give the same id,
+# and consecutive members still get unrelated-looking ids. The round keys
+# are part of the id format and must never change.
+
+SEQUENCE_NAME = "member_id"
+BLOCK_SIZE = 1000
+TRANSACTION_BLOCK_SIZE = 100
+ID_BITS = 24
+ID_SPACE = 1 << ID_BITS
+
+_HALF_BITS = ID_BITS // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_ROUND_KEYS = (0x5A3, 0xC1E, 0x2F7, 0x9B4)
+
+
+def _round(half, key):
+    half = (half * 0x9E5 + key) & _HALF_MASK
+    return (half ^ (half >> 5) ^ (half * 0x3B << 3)) & _HALF_MASK
+
+
+def permute(value):
+    """Map a counter value in [0, 2**24) onto a unique 24-bit id."""
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for key in _ROUND_KEYS:
+        left, right = right, left ^ _round(right, key)
+    return (left << _HALF_BITS) | right
+
+
+def format_member_id(value):
+    return f"USR{permute(value):06X}"
+
+
+def reserve_counter(count, name=SEQUENCE_NAME):
+    """Advance the sequence `name` by `count` and return the first reserved value."""
+    from app.models import MemberIdSequence
+
+    with transaction.atomic():
+        sequence, _ = MemberIdSequence.objects.select_for_update().get_or_create(name=name)
+        start = sequence.next_value
+        if start + count > ID_SPACE:
+            raise RuntimeError("Member id space is exhausted")
+        sequence.next_value = start + count
+        sequence.save(update_fields=["next_value"])
+    return start
+
+
+def _without_taken(member_ids):
+    # Ids issued before the allocator existed were random, so a fresh block
+    # may overlap a few of them; one query per block weeds those out.
+    from app.models import UserProfile
+
+    taken = set(
+        UserProfile.objects.filter(member_id__in=member_ids)
+        .values_list("member_id", flat=True)
+    )
+    return [member_id for member_id in member_ids if member_id not in taken]
+
+
+class MemberIdAllocator:
+    """
+    Hands out member ids from blocks of the sequence `name`.
+
+    A block reserved outside a transaction is kept between calls. One
+    reserved inside a transaction (at least `transaction_block_size` ids)
+    serves the rest of that transaction, and what is left of it joins the
+    kept ids only once the transaction commits: a rollback rewinds the
+    sequence, so its ids would be handed out again. A rollback is noticed
+    because it discards the block's on_commit callback. A forked worker
+    starts with no block rather than sharing its parent's.
+    """
+
+    def __init__(self, name=SEQUENCE_NAME, block_size=BLOCK_SIZE,
+                 transaction_block_size=TRANSACTION_BLOCK_SIZE):
+        self.name = name
+        self.block_size = block_size
+        self.transaction_block_size = transaction_block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._ids = deque()
+        # (ids, on_commit callback) of the block serving the current transaction
+        self._transaction_block = None
+
+    def _reserve(self, count):
+        start = reserve_counter(count, self.name)
+        return _without_taken([format_member_id(value) for value in range(start, start + count)])
+
+    def _current_transaction_ids(self, connection):
+        """The ids of the block reserved in this transaction, if it still holds."""
+        if self._transaction_block is None:
+            return None
+        ids, keep = self._transaction_block
+        if not any(entry[1] is keep for entry in connection.run_on_commit):
+            self._transaction_block = None
+            return None
+        return ids
+
+    def _reserve_in_transaction(self, connection, count):
+        ids = deque(self._reserve(max(count, self.transaction_block_size)))
+
+        def keep():
+            with self._lock:
+                self._ids.extend(ids)
+                ids.clear()
+                if self._transaction_block is not None and self._transaction_block[0] is ids:
+                    self._transaction_block = None
+
+        transaction.on_commit(keep, using=connection.alias)
+        self._transaction_block = (ids, keep)
+        return ids
+
+    def allocate(self, count=1):
+        """`count` unused member ids."""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._ids.clear()
+                self._transaction_block = None
+
+            member_ids = []
+            while self._ids and len(member_ids) < count:
+                member_ids.append(self._ids.popleft())
+
+            connection = transaction.get_connection()
+            while len(member_ids) < count:
+                needed = count - len(member_ids)
+                if connection.in_atomic_block:
+                    ids = self._current_transaction_ids(connection)
+                    if not ids:
+                        ids = self._reserve_in_transaction(connection, needed)
+                else:
+                    ids = self._ids
+                    ids.extend(self._reserve(max(needed, self.block_size)))
+                while ids and len(member_ids) < count:
+                    member_ids.append(ids.popleft())
+            return member_ids
+
+
+_allocator = MemberIdAllocator()
+
+
+def allocate_member_ids(count):
+    return _allocator.allocate(count)
+
+
+def next_member_id():
+    return _allocator.allocate(1)[0]
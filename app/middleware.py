@@ -0,0 +1,70 @@
+import json
+import logging
+
+from django.conf import settings
+
+from app.querybudget import QueryLog
+from app.routers import pin_to_primary
+
+logger = logging.getLogger("app.querybudget")
+
+
+class QueryBudgetMiddleware:
+    """
+    Count the SQL each request runs and flag statements repeated more than
+    settings.QUERY_BUDGET_REPEAT_THRESHOLD times (N+1 loops) or requests over
+    settings.QUERY_BUDGET_MAX_QUERIES.
+
+    Every request gets a JSON log line on the app.querybudget logger, at
+    WARNING level when it is over budget. With settings.QUERY_BUDGET_HEADERS
+    the figures are also sent as X-Query-* response headers. Queries run
+    while a streaming response is sent happen after this point and are not
+    counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryLog() as log:
+            response = self.get_response(request)
+
+        repeats = log.repeats()
+        over_budget = log.count > settings.QUERY_BUDGET_MAX_QUERIES or bool(repeats)
+
+        if settings.QUERY_BUDGET_HEADERS:
+            response["X-Query-Count"] = str(log.count)
+            response["X-Query-Time-Ms"] = f"{log.total_ms:.1f}"
+            response["X-Query-Repeats"] = str(sum(n for shape, n in repeats))
+
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "queries": log.count,
+                "query_ms": round(log.total_ms, 1),
+                "repeats": [{"count": n, "sql": shape} for shape, n in repeats],
+            }),
+        )
+        return response
+
+
+class PrimaryPinMiddleware:
+    """
+    Pin a user to the primary database after any request that wrote to it,
+    so their next reports do not come from a lagging replica. Writes are
+    detected from the statements run, not the HTTP method: several views
+    write on GET.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryLog() as log:
+            response = self.get_response(request)
+        if log.wrote:
+            pin_to_primary(request)
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_months(apps, schema_editor):
+    """Keep one charge/reward per (user, month) so the constraints can apply."""
+    MonthlyCharge = apps.get_model("app", "MonthlyCharge")
+    MonthlyReward = apps.get_model("app", "MonthlyReward")
+
+    seen = {}
+    for charge in MonthlyCharge.objects.order_by("id"):
+        key = (charge.user_id, charge.charge_month)
+        kept = seen.get(key)
+        if kept is None:
+            seen[key] = charge
+            continue
+        if charge.paid and not kept.paid:
+            MonthlyCharge.objects.filter(id=kept.id).update(paid=True)
+            kept.paid = True
+        charge.delete()
+
+    seen = set()
+    for reward in MonthlyReward.objects.order_by("id"):
+        key = (reward.user_id, reward.reward_month)
+        if key in seen:
+            reward.delete()
+        else:
+            seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_months, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlycharge',
+            constraint=models.UniqueConstraint(fields=('user', 'charge_month'), name='unique_charge_per_user_month'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyreward',
+            constraint=models.UniqueConstraint(fields=('user', 'reward_month'), name='unique_reward_per_user_month'),
+        ),
+    ]
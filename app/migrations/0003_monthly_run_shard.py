@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0002_ledger_unique_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRunShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('start_id', models.BigIntegerField()),
+                ('end_id', models.BigIntegerField()),
+                ('charges', models.PositiveIntegerField(default=0)),
+                ('rewards', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('duration', models.FloatField(default=0)),
+                ('finished_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('month', 'start_id', 'end_id'), name='unique_shard_per_month')],
+            },
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q
+
+
+def populate_summaries(apps, schema_editor):
+    MonthlyCharge = apps.get_model("app", "MonthlyCharge")
+    MonthlyReward = apps.get_model("app", "MonthlyReward")
+    MemberLedgerSummary = apps.get_model("app", "MemberLedgerSummary")
+
+    summaries = {}
+    for row in MonthlyCharge.objects.values("user_id").annotate(
+        paid_count=Count("id", filter=Q(paid=True)),
+        pending_count=Count("id", filter=Q(paid=False)),
+        last_paid=Max("charge_month", filter=Q(paid=True)),
+    ):
+        summaries[row["user_id"]] = MemberLedgerSummary(
+            user_id=row["user_id"],
+            months_paid=row["paid_count"],
+            months_pending=row["pending_count"],
+            last_paid_month=row["last_paid"],
+        )
+
+    for row in MonthlyReward.objects.values("user_id").annotate(
+        received=Count("id"), last=Max("reward_month")
+    ):
+        summary = summaries.setdefault(
+            row["user_id"], MemberLedgerSummary(user_id=row["user_id"])
+        )
+        summary.rewards_received = row["received"]
+        summary.last_reward_month = row["last"]
+
+    MemberLedgerSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_monthly_run_shard'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberLedgerSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ledger_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('months_paid', models.PositiveIntegerField(default=0)),
+                ('months_pending', models.PositiveIntegerField(default=0)),
+                ('rewards_received', models.PositiveIntegerField(default=0)),
+                ('last_paid_month', models.DateField(blank=True, null=True)),
+                ('last_reward_month', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_summaries, migrations.RunPython.noop),
+    ]
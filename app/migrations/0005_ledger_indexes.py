@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_member_ledger_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='emailtoken',
+            name='expiry',
+            field=models.DateTimeField(db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='monthlycharge',
+            index=models.Index(fields=['user', 'paid', 'charge_month'], name='charge_user_paid_month_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlycharge',
+            index=models.Index(fields=['charge_month', 'paid'], name='charge_month_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyreward',
+            index=models.Index(fields=['reward_month'], name='reward_month_idx'),
+        ),
+    ]
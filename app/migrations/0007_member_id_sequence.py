@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+def create_sequence(apps, schema_editor):
+    MemberIdSequence = apps.get_model("app", "MemberIdSequence")
+    MemberIdSequence.objects.get_or_create(name="member_id")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_email_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MemberIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_sequence, migrations.RunPython.noop),
+    ]
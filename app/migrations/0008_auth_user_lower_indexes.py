@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:40
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Case-insensitive lookup indexes for EmailOrUsernameBackend. auth_user
+    belongs to django.contrib.auth, so they are created with raw SQL.
+    """
+
+    dependencies = [
+        ('app', '0007_member_id_sequence'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX auth_user_username_lower_idx ON auth_user (LOWER(username));",
+            "DROP INDEX auth_user_username_lower_idx;",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX auth_user_email_lower_idx ON auth_user (LOWER(email));",
+            "DROP INDEX auth_user_email_lower_idx;",
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def populate_rollups(apps, schema_editor):
+    MonthlyCharge = apps.get_model("app", "MonthlyCharge")
+    Scheme = apps.get_model("app", "Scheme")
+    SchemeMonthlyRollup = apps.get_model("app", "SchemeMonthlyRollup")
+
+    prices = dict(Scheme.objects.values_list("id", "monthly_charge"))
+    rollups = []
+    for row in (
+        MonthlyCharge.objects.filter(user__userprofile__scheme__isnull=False)
+        .values("user__userprofile__scheme_id", "charge_month")
+        .annotate(expected=Count("id"), collected=Count("id", filter=Q(paid=True)))
+    ):
+        price = prices[row["user__userprofile__scheme_id"]]
+        pending = row["expected"] - row["collected"]
+        rollups.append(SchemeMonthlyRollup(
+            scheme_id=row["user__userprofile__scheme_id"],
+            month=row["charge_month"],
+            expected_count=row["expected"],
+            collected_count=row["collected"],
+            pending_count=pending,
+            expected_amount=row["expected"] * price,
+            collected_amount=row["collected"] * price,
+            pending_amount=pending * price,
+        ))
+
+    SchemeMonthlyRollup.objects.bulk_create(rollups, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_auth_user_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SchemeMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('expected_count', models.IntegerField(default=0)),
+                ('collected_count', models.IntegerField(default=0)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('expected_amount', models.BigIntegerField(default=0)),
+                ('collected_amount', models.BigIntegerField(default=0)),
+                ('pending_amount', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('scheme', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='app.scheme')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month'], name='rollup_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scheme', 'month'), name='unique_rollup_per_scheme_month')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:29
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # Existing rows count as last changed when they were created
+    for name in ("MonthlyCharge", "MonthlyReward"):
+        apps.get_model("app", name).objects.update(updated_at=F("created_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_scheme_monthly_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlycharge',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='monthlyreward',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='monthlycharge',
+            index=models.Index(fields=['updated_at', 'id'], name='charge_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyreward',
+            index=models.Index(fields=['updated_at', 'id'], name='reward_updated_idx'),
+        ),
+    ]
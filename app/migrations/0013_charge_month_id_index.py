@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_scheduler'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='monthlycharge',
+            index=models.Index(fields=['charge_month', 'id'], name='charge_month_id_idx'),
+        ),
+    ]
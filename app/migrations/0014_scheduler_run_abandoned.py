@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_charge_month_id_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='schedulerrun',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('done', 'Done'), ('failed', 'Failed'), ('abandoned', 'Abandoned')], default='running', max_length=10),
+        ),
+    ]
@@ -1,13 +1,19 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
 
+
 # --------------------------
-# Utility: Generate Member ID
+# Member ID Sequence
 # --------------------------
-def generate_member_id():
-    return "USR" + uuid.uuid4().hex[:6].upper()
+class MemberIdSequence(models.Model):
+    """Counter behind the member id allocator (see app.member_ids)."""
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
 
 
 # --------------------------
@@ -31,14 +37,80 @@ class UserProfile(models.Model):
     scheme = models.ForeignKey(Scheme, on_delete=models.SET_NULL, null=True)
     member_id = models.CharField(max_length=20, unique=True, blank=True)
 
+    # Fields whose changes make the profile worth saving
+    TRACKED_FIELDS = ("user_id", "scheme_id", "member_id")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._saved_values = {}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._mark_clean()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self._mark_clean(fields)
+
+    def _mark_clean(self, fields=None):
+        # Read __dict__ rather than the attributes: reading a deferred field
+        # would load it, building another instance while this one is built
+        deferred = self.get_deferred_fields()
+        if fields is not None:
+            fields = {self._meta.get_field(name).attname for name in fields}
+        self._saved_values.update({
+            name: self.__dict__[name]
+            for name in self.TRACKED_FIELDS
+            if name not in deferred and (fields is None or name in fields)
+        })
+
+    def changed_fields(self):
+        """
+        Tracked fields that differ from what was loaded or last saved. A
+        field deferred at load counts as changed once it is assigned.
+        """
+        return [
+            name for name in self.TRACKED_FIELDS
+            if name in self.__dict__
+            and (name not in self._saved_values or self.__dict__[name] != self._saved_values[name])
+        ]
+
+    def saved_value(self, name):
+        """Value of tracked field `name` as loaded or last saved."""
+        if name not in self._saved_values:
+            return UserProfile.objects.filter(pk=self.pk).values_list(name, flat=True).first()
+        return self._saved_values[name]
+
+    def has_changed(self):
+        return self._state.adding or bool(self.changed_fields())
+
     def save(self, *args, **kwargs):
-        # Generate member ID if it doesn't exist
-        if not self.member_id:
-            self.member_id = generate_member_id()
-            # Ensure uniqueness
-            while UserProfile.objects.filter(member_id=self.member_id).exists():
-                self.member_id = generate_member_id()
-        super().save(*args, **kwargs)
+        if self.member_id:
+            super().save(*args, **kwargs)
+            self._mark_clean()
+            return
+
+        from app.member_ids import next_member_id
+
+        # Allocated ids are unique among themselves; an id typed in by hand
+        # can still collide, so take the next one if it does.
+        while True:
+            self.member_id = next_member_id()
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                self._mark_clean()
+                return
+            except IntegrityError:
+                if not UserProfile.objects.filter(member_id=self.member_id).exists():
+                    raise
+
+    def get_scheme(self):
+        """This profile's scheme from the in-process catalog (see app.cache)."""
+        from app.cache import get_scheme
+        return get_scheme(self.scheme_id)
 
     def __str__(self):
         return f"{self.user.username} ({self.member_id})"
@@ -51,10 +123,24 @@ class MonthlyCharge(models.Model):
     charge_month = models.DateField()   # month only
     paid = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set explicitly by queryset updates and upserts too; drives the delta export
+    updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "charge_month"], name="unique_charge_per_user_month"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "paid", "charge_month"], name="charge_user_paid_month_idx"),
+            models.Index(fields=["charge_month", "paid"], name="charge_month_paid_idx"),
+            models.Index(fields=["charge_month", "id"], name="charge_month_id_idx"),
+            models.Index(fields=["updated_at", "id"], name="charge_updated_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.user.email} - {self.month} Charge"
+        return f"{self.user.email} - {self.charge_month} Charge"
 
 
 # --------------------------
@@ -65,10 +151,78 @@ class MonthlyReward(models.Model):
     reward_month = models.DateField()   # month only
     reward_text = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set explicitly by queryset updates and upserts too; drives the delta export
+    updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "reward_month"], name="unique_reward_per_user_month"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["reward_month"], name="reward_month_idx"),
+            models.Index(fields=["updated_at", "id"], name="reward_updated_idx"),
+        ]
 
     def __str__(self):
-        return f"{self.user.email} - {self.month} Reward"
+        return f"{self.user.email} - {self.reward_month} Reward"
+
+
+# --------------------------
+# Member Ledger Summary
+# --------------------------
+class MemberLedgerSummary(models.Model):
+    """
+    Per-member totals of MonthlyCharge/MonthlyReward, kept in step by
+    app.utils.refresh_ledger_summaries wherever the ledger is written.
+    """
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="ledger_summary"
+    )
+    months_paid = models.PositiveIntegerField(default=0)
+    months_pending = models.PositiveIntegerField(default=0)
+    rewards_received = models.PositiveIntegerField(default=0)
+    last_paid_month = models.DateField(null=True, blank=True)
+    last_reward_month = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} ledger summary"
+
+
+# --------------------------
+# Scheme Monthly Rollup
+# --------------------------
+class SchemeMonthlyRollup(models.Model):
+    """
+    Charges billed, paid and pending per scheme and month, kept in step by
+    app.utils wherever charges are created or paid. Amounts are counts
+    times the scheme's monthly_charge.
+    """
+    scheme = models.ForeignKey(Scheme, on_delete=models.CASCADE, related_name="rollups")
+    month = models.DateField()
+    expected_count = models.IntegerField(default=0)
+    collected_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    expected_amount = models.BigIntegerField(default=0)
+    collected_amount = models.BigIntegerField(default=0)
+    pending_amount = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["scheme", "month"],
+                name="unique_rollup_per_scheme_month",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["month"], name="rollup_month_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.scheme} - {self.month:%Y-%m}"
 
 
 # --------------------------
@@ -77,9 +231,183 @@ class MonthlyReward(models.Model):
 class EmailToken(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     token = models.UUIDField(default=uuid.uuid4, unique=True)
-    expiry = models.DateTimeField()
+    expiry = models.DateTimeField(db_index=True)
     used = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def is_valid(self):
         return (not self.used) and (self.expiry > timezone.now())
+
+
+# --------------------------
+# Monthly Run Checkpoint
+# --------------------------
+class MonthlyRunShard(models.Model):
+    """One committed slice [start_id, end_id) of a monthly run."""
+    month = models.DateField()
+    start_id = models.BigIntegerField()
+    end_id = models.BigIntegerField()
+    charges = models.PositiveIntegerField(default=0)
+    rewards = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    duration = models.FloatField(default=0)   # seconds
+    finished_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["month", "start_id", "end_id"], name="unique_shard_per_month"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} [{self.start_id}, {self.end_id})"
+
+
+# --------------------------
+# Monthly Run Job
+# --------------------------
+class MonthlyJob(models.Model):
+    """
+    A monthly run queued from the dashboard and executed shard by shard by
+    the runjobs worker, which keeps the progress counters current. Only one
+    job per month can be queued or running at a time.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+    ACTIVE = [QUEUED, RUNNING]
+
+    month = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    requested_by = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    members_total = models.PositiveIntegerField(default=0)
+    members_done = models.PositiveIntegerField(default=0)
+    shards_total = models.PositiveIntegerField(default=0)
+    shards_done = models.PositiveIntegerField(default=0)
+    inserted = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["month"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="one_active_job_per_month",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="job_status_idx"),
+        ]
+
+    def eta_seconds(self):
+        """Seconds left at the rate so far, or None before the first shard."""
+        if self.status != self.RUNNING or not self.members_done or self.started_at is None:
+            return None
+        elapsed = (timezone.now() - self.started_at).total_seconds()
+        remaining = max(self.members_total - self.members_done, 0)
+        return elapsed / self.members_done * remaining
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} #{self.pk} ({self.status})"
+
+
+# --------------------------
+# Scheduler
+# --------------------------
+class SchedulerLease(models.Model):
+    """
+    A named lock held by one scheduler process until `expires_at`. The
+    holder renews it while working; anyone may take it once it expires.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    owner = models.CharField(max_length=100)
+    acquired_at = models.DateTimeField()
+    heartbeat_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.owner} until {self.expires_at}"
+
+
+class SchedulerRun(models.Model):
+    """One scheduled monthly run, successful or not, and how long it took."""
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    # Handed over to another scheduler or worker mid-run; not a failed attempt
+    ABANDONED = "abandoned"
+    STATUS_CHOICES = [
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+        (ABANDONED, "Abandoned"),
+    ]
+
+    month = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=RUNNING)
+    owner = models.CharField(max_length=100)
+    job = models.ForeignKey(MonthlyJob, null=True, blank=True, on_delete=models.SET_NULL)
+    catch_up = models.BooleanField(default=False)   # run late, for a month missed during downtime
+    inserted = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(default=0)   # seconds
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "month"], name="scheduler_run_month_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} ({self.status})"
+
+
+# --------------------------
+# Email Outbox
+# --------------------------
+class EmailOutbox(models.Model):
+    """
+    Mail waiting to be sent by the sendoutbox worker. Rows are written in
+    the same transaction as whatever the mail is about, so nothing is
+    sent for work that rolled back and nothing is lost if SMTP is down.
+    """
+    PENDING = "pending"
+    SENT = "sent"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (SENT, "Sent"),
+        (FAILED, "Failed"),
+    ]
+
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.to_email} - {self.subject} ({self.status})"
@@ -0,0 +1,100 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+# --------------------------
+# Per-request query capture
+# --------------------------
+# Statements are grouped by shape: literals and IN lists are folded so that
+# the same lookup for different rows counts as one statement repeated, which
+# is what an N+1 loop looks like.
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:[^()]*)\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+_WRITE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+
+def normalize(sql):
+    """The shape of a statement, with its literal values removed."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+class QueryLog:
+    """Records every statement run on any database while it is active."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for alias in connections:
+            self._stack.enter_context(connections[alias].execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(duration for sql, duration in self.queries) * 1000
+
+    @property
+    def wrote(self):
+        """Whether any recorded statement changed rows."""
+        return any(_WRITE.match(sql) for sql, duration in self.queries)
+
+    def repeats(self, threshold=None):
+        """Statement shapes run more than `threshold` times, most frequent first."""
+        if threshold is None:
+            threshold = settings.QUERY_BUDGET_REPEAT_THRESHOLD
+        shapes = Counter(normalize(sql) for sql, duration in self.queries)
+        return [(shape, n) for shape, n in shapes.most_common() if n > threshold]
+
+
+def assert_query_budget(view, max_queries, client=None, args=None, kwargs=None, repeat_threshold=None):
+    """
+    GET `view` (a URL name or a path) and raise AssertionError when it runs
+    more than `max_queries` statements or repeats a statement shape more
+    than `repeat_threshold` times. Pass a logged-in test Client for views
+    that need one. Returns the QueryLog.
+    """
+    from django.test import Client
+
+    client = client or Client()
+    path = view if view.startswith("/") else reverse(view, args=args, kwargs=kwargs)
+
+    with QueryLog() as log:
+        response = client.get(path)
+        if response.streaming:
+            b"".join(response.streaming_content)
+
+    problems = []
+    if log.count > max_queries:
+        problems.append(f"{log.count} queries, budget is {max_queries}")
+    for shape, n in log.repeats(repeat_threshold):
+        problems.append(f"repeated {n}x: {shape}")
+    if problems:
+        raise AssertionError(f"{path}: " + "\n  ".join(problems))
+    return log
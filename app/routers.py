@@ -0,0 +1,87 @@
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# --------------------------
+# Reporting replica routing
+# --------------------------
+# Views marked @use_replica read from the `reporting` database alias, so
+# long reports and CSV exports do not hold up payment writes on `default`.
+# Writes always go to `default`. A user who has just written is pinned to
+# `default` for settings.REPLICA_PIN_SECONDS, so they never read their own
+# change back from a replica that has not caught up yet.
+
+REPLICA_ALIAS = "reporting"
+PIN_SESSION_KEY = "db_pinned_until"
+
+_reading_replica = ContextVar("reading_replica", default=False)
+
+
+def replica_available():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def pin_to_primary(request):
+    """Keep this user's reads on `default` for the next few seconds."""
+    if hasattr(request, "session"):
+        request.session[PIN_SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+
+
+def is_pinned(request):
+    session = getattr(request, "session", None)
+    return session is not None and session.get(PIN_SESSION_KEY, 0) > time.time()
+
+
+def _stream_from_replica(content):
+    # The body may be consumed in another context than the one a token
+    # would belong to, so restore the flag by value instead of reset()
+    previous = _reading_replica.get()
+    _reading_replica.set(True)
+    try:
+        yield from content
+    finally:
+        _reading_replica.set(previous)
+
+
+def use_replica(view):
+    """
+    Route the reads of `view` to the reporting replica, including the ones
+    made while a streaming response is being sent.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica_available() or is_pinned(request):
+            return view(request, *args, **kwargs)
+
+        token = _reading_replica.set(True)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _reading_replica.reset(token)
+
+        if response.streaming:
+            response.streaming_content = _stream_from_replica(response.streaming_content)
+        return response
+
+    return wrapper
+
+
+class ReportingRouter:
+    """Reads inside @use_replica go to the replica; everything else to default."""
+
+    def db_for_read(self, model, **hints):
+        if _reading_replica.get():
+            return REPLICA_ALIAS
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -0,0 +1,242 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.utils import timezone
+
+from app.models import MonthlyJob, SchedulerLease, SchedulerRun
+from app.utils import JobTakenOver, claim_monthly_job, enqueue_monthly_job, run_monthly_job
+
+# --------------------------
+# Month-end scheduler
+# --------------------------
+# Any number of scheduler processes may run; the one holding the "monthly"
+# SchedulerLease does the work. The lease is taken and renewed with a
+# single conditional UPDATE, so two processes can never both hold it, and
+# it expires SCHEDULER_LEASE_SECONDS after the last heartbeat so a crashed
+# holder is replaced. While a month is billed a LeaseKeeper thread renews
+# the lease on a timer, so one long shard does not let it lapse, and the
+# lease is checked again after every shard; a holder that finds its lease
+# gone stops mid-month and the next holder bills the month again, which
+# only fills in what is left.
+#
+# A month is due once its MONTHLY_RUN_DAY / MONTHLY_RUN_TIME in TIME_ZONE
+# has passed. Due months not yet billed are caught up, oldest first, going
+# back at most MONTHLY_RUN_CATCHUP_MONTHS and never before the month of
+# the first scheduled run. A month that fails is retried with exponential
+# backoff from MONTHLY_RUN_RETRY_SECONDS, and left alone after
+# MONTHLY_RUN_MAX_ATTEMPTS failures; running it from the dashboard, or
+# deleting its failed SchedulerRuns, puts it back in the scheduler's hands.
+# A run cut short by losing the lease or the job is recorded as ABANDONED
+# and does not count as an attempt.
+
+LEASE_NAME = "monthly"
+
+
+class LeaseLost(Exception):
+    """Raised when another process has taken over the lease."""
+
+
+def make_owner():
+    """A name for this process that is unique across hosts and restarts."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(owner, name=LEASE_NAME, seconds=None):
+    """
+    Take or renew the lease `name` for `owner`. True when `owner` holds it
+    for the next `seconds` (default settings.SCHEDULER_LEASE_SECONDS).
+    """
+    seconds = seconds or settings.SCHEDULER_LEASE_SECONDS
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=seconds)
+
+    renewed = SchedulerLease.objects.filter(name=name, owner=owner).update(
+        heartbeat_at=now, expires_at=expires_at
+    )
+    if renewed:
+        return True
+
+    taken = SchedulerLease.objects.filter(name=name, expires_at__lt=now).update(
+        owner=owner, acquired_at=now, heartbeat_at=now, expires_at=expires_at
+    )
+    if taken:
+        return True
+
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(
+                name=name, owner=owner, acquired_at=now, heartbeat_at=now, expires_at=expires_at
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def release_lease(owner, name=LEASE_NAME):
+    SchedulerLease.objects.filter(name=name, owner=owner).delete()
+
+
+class LeaseKeeper(threading.Thread):
+    """
+    Renews `owner`'s lease every third of SCHEDULER_LEASE_SECONDS until
+    stopped, on its own database connection. `lost` is set once a renewal
+    finds the lease held by someone else. A renewal that errors (SQLite
+    blocks writers while a shard commits) is simply tried again.
+    """
+
+    def __init__(self, owner):
+        super().__init__(name="lease-keeper", daemon=True)
+        self.owner = owner
+        self.lost = threading.Event()
+        self._stopping = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stopping.wait(settings.SCHEDULER_LEASE_SECONDS / 3):
+                try:
+                    held = acquire_lease(self.owner)
+                except DatabaseError:
+                    continue
+                if not held:
+                    self.lost.set()
+                    return
+        finally:
+            connections.close_all()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+def scheduled_at(month):
+    """When the run for `month` is due, as an aware datetime in TIME_ZONE."""
+    hour, minute = (int(part) for part in settings.MONTHLY_RUN_TIME.split(":"))
+    return timezone.make_aware(
+        datetime(month.year, month.month, settings.MONTHLY_RUN_DAY, hour, minute)
+    )
+
+
+def _previous_month(month):
+    return (month - timedelta(days=1)).replace(day=1)
+
+
+def _billed(month):
+    """Whether `month` was billed after its scheduled time, by us or a job."""
+    return (
+        SchedulerRun.objects.filter(month=month, status=SchedulerRun.DONE).exists()
+        or MonthlyJob.objects.filter(
+            month=month, status=MonthlyJob.DONE, created_at__gte=scheduled_at(month)
+        ).exists()
+    )
+
+
+def due_months(now=None):
+    """
+    Months whose scheduled run has passed and that are not billed yet,
+    oldest first. Before any scheduled run, only the latest due month.
+    """
+    now = now or timezone.now()
+    latest = timezone.localdate(now).replace(day=1)
+    if scheduled_at(latest) > now:
+        latest = _previous_month(latest)
+
+    first = SchedulerRun.objects.order_by("month").values_list("month", flat=True).first()
+    if first is None:
+        return [latest]
+
+    months = []
+    month = latest
+    for _ in range(settings.MONTHLY_RUN_CATCHUP_MONTHS):
+        if month < first:
+            break
+        if not _billed(month):
+            months.append(month)
+        month = _previous_month(month)
+    return months[::-1]
+
+
+def retry_at(month):
+    """
+    When `month` may be tried again after failing: None when it may run
+    now, False once it has failed MONTHLY_RUN_MAX_ATTEMPTS times.
+    """
+    failures = SchedulerRun.objects.filter(month=month, status=SchedulerRun.FAILED)
+    count = failures.count()
+    if not count:
+        return None
+    if count >= settings.MONTHLY_RUN_MAX_ATTEMPTS:
+        return False
+    last = failures.order_by("-finished_at").values_list("finished_at", flat=True).first()
+    delay = settings.MONTHLY_RUN_RETRY_SECONDS * 2 ** (count - 1)
+    when = last + timedelta(seconds=delay)
+    return when if when > timezone.now() else None
+
+
+def run_month(month, owner, catch_up=False, shard_size=None):
+    """
+    Bill `month` through a MonthlyJob while holding the lease, and record
+    the attempt as a SchedulerRun. Returns the run, or None when a runjobs
+    worker is already billing the month (it is picked up again next tick).
+    """
+    enqueue_monthly_job(month)
+    job = claim_monthly_job(month)
+    if job is None:
+        return None
+
+    run = SchedulerRun.objects.create(month=month, owner=owner, job=job, catch_up=catch_up)
+    started = time.monotonic()
+    keeper = LeaseKeeper(owner)
+
+    def heartbeat(job):
+        if keeper.lost.is_set() or not acquire_lease(owner):
+            raise LeaseLost(f"lease {LEASE_NAME!r} taken over while billing {month:%Y-%m}")
+
+    keeper.start()
+    try:
+        options = {"shard_size": shard_size} if shard_size else {}
+        run_monthly_job(job, on_shard=heartbeat, **options)
+        run.inserted = job.inserted
+        run.status = SchedulerRun.DONE
+    except (LeaseLost, JobTakenOver) as exc:
+        # A handover, not a failure: the next holder resumes the month at
+        # once instead of backing off
+        run.status = SchedulerRun.ABANDONED
+        run.error = repr(exc)
+        if isinstance(exc, LeaseLost):
+            raise
+    except Exception as exc:
+        run.status = SchedulerRun.FAILED
+        run.error = repr(exc)
+    finally:
+        keeper.stop()
+        run.duration = time.monotonic() - started
+        run.finished_at = timezone.now()
+        run.save()
+
+    return run
+
+
+def tick(owner, shard_size=None):
+    """
+    One scheduler pass: take or renew the lease and, if held, run every due
+    month that is not backing off after a failure. Returns the
+    SchedulerRuns made, or None without the lease.
+    """
+    if not acquire_lease(owner):
+        return None
+
+    runs = []
+    months = due_months()
+    for month in months:
+        if retry_at(month) is not None:
+            continue
+        run = run_month(month, owner, catch_up=month != months[-1], shard_size=shard_size)
+        if run is not None:
+            runs.append(run)
+    return runs
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .backends import forget_login_failures
+from .cache import invalidate_all_member_pages, invalidate_member_pages
+from .models import UserProfile, Scheme, MonthlyCharge, MonthlyReward
+from .utils import (
+    bump_scheme_rollups,
+    charge_rollup_deltas,
+    refresh_ledger_summaries,
+    reprice_scheme_rollups,
+)
 
 
 @receiver(post_save, sender=User)
@@ -16,7 +25,119 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """
-    Save UserProfile when User is saved
+    Save the UserProfile along with its User, but only a profile that was
+    loaded onto this User and edited since. The last_login update on every
+    login therefore writes nothing to app_userprofile.
     """
-    if hasattr(instance, 'userprofile'):
-        instance.userprofile.save()
\ No newline at end of file
+    if not User.userprofile.related.is_cached(instance):
+        return
+    profile = instance.userprofile
+    if profile.has_changed():
+        profile.save()
+
+
+@receiver(post_save, sender=User)
+def forget_failures_on_password_change(sender, instance, **kwargs):
+    """
+    A user saved after set_password() still carries the raw password
+    (until AbstractBaseUser.save clears it), which is what the login
+    failure cache is keyed on.
+    """
+    if instance._password is not None:
+        forget_login_failures(instance, instance._password)
+
+
+def _deleting_member(origin):
+    """Whether a delete cascaded from deleting users."""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is User
+
+
+@receiver(post_delete, sender=MonthlyCharge)
+@receiver(post_delete, sender=MonthlyReward)
+def refresh_summary_on_delete(sender, instance, origin=None, **kwargs):
+    """
+    Keep the member's ledger summary in step when a ledger row is removed.
+    Not when the member is being deleted: the summary goes with them, and
+    writing it back would break the foreign key at commit.
+    """
+    if _deleting_member(origin):
+        return
+    if User.objects.filter(id=instance.user_id).exists():
+        refresh_ledger_summaries([instance.user_id])
+
+
+@receiver(pre_delete, sender=User)
+def drop_member_from_rollups(sender, instance, **kwargs):
+    """
+    Take a member's charges out of the rollup before they go, while the
+    profile still says which scheme they count under.
+    """
+    charges = MonthlyCharge.objects.filter(user_id=instance.pk).values_list("charge_month", "paid")
+    bump_scheme_rollups(
+        charge_rollup_deltas([(-1, instance.pk, month, paid) for month, paid in charges])
+    )
+
+
+@receiver(post_delete, sender=MonthlyCharge)
+def drop_charge_from_rollup(sender, instance, origin=None, **kwargs):
+    """
+    Take the charge out of its scheme/month cell. Charges of a member being
+    deleted were taken out together by drop_member_from_rollups.
+    """
+    if _deleting_member(origin):
+        return
+    bump_scheme_rollups(
+        charge_rollup_deltas([(-1, instance.user_id, instance.charge_month, instance.paid)])
+    )
+
+
+@receiver(post_save, sender=UserProfile)
+def move_rollups_on_scheme_change(sender, instance, created, **kwargs):
+    """
+    A member changing scheme takes their charges along: each month they
+    were billed moves from the old scheme's cell to the new one's.
+    """
+    if created or "scheme_id" not in instance.changed_fields():
+        return
+    old, new = instance.saved_value("scheme_id"), instance.scheme_id
+    deltas = {}
+    for month, paid in MonthlyCharge.objects.filter(user_id=instance.user_id).values_list(
+        "charge_month", "paid"
+    ):
+        for scheme_id, sign in ((old, -1), (new, 1)):
+            if scheme_id is not None:
+                expected, collected = deltas.get((scheme_id, month), (0, 0))
+                deltas[(scheme_id, month)] = (expected + sign, collected + sign * paid)
+    bump_scheme_rollups(deltas)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_save, sender=MonthlyCharge)
+@receiver(post_delete, sender=MonthlyCharge)
+@receiver(post_save, sender=MonthlyReward)
+@receiver(post_delete, sender=MonthlyReward)
+def invalidate_member_page_cache(sender, instance, **kwargs):
+    """
+    Drop the cached user-panel pages of the member this row belongs to
+    """
+    invalidate_member_pages([instance.user_id])
+
+
+@receiver(post_save, sender=Scheme)
+@receiver(post_delete, sender=Scheme)
+def invalidate_scheme_page_cache(sender, instance, **kwargs):
+    """
+    Scheme details show on every member's pages, so drop them all
+    """
+    invalidate_all_member_pages()
+
+
+@receiver(post_save, sender=Scheme)
+def reprice_rollups(sender, instance, created, **kwargs):
+    """
+    Rollup amounts are counts times monthly_charge, so follow a price change
+    """
+    if not created:
+        reprice_scheme_rollups(instance)
@@ -0,0 +1,394 @@
+import os
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from app import cache as app_cache
+from app.arrears import Arrears
+from app.management.commands.checkqueryplans import checked_queries, plan_problems
+from app.member_ids import MemberIdAllocator
+from app.models import (
+    EmailOutbox,
+    MemberIdSequence,
+    MemberLedgerSummary,
+    MonthlyCharge,
+    MonthlyReward,
+    Scheme,
+    SchedulerLease,
+    SchedulerRun,
+    SchemeMonthlyRollup,
+    UserProfile,
+)
+from app.querybudget import assert_query_budget
+from app.routers import PIN_SESSION_KEY
+from app.scheduler import LeaseLost, acquire_lease, retry_at, run_month, tick
+from app.utils import (
+    RejectPreview,
+    send_outbox_batch,
+    current_month,
+    generate_monthly_entries,
+    mark_paid,
+    reconcile_statement,
+    refresh_scheme_rollups,
+    save_charge,
+)
+
+
+class DeleteMemberTests(TestCase):
+    def setUp(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        self.user = User.objects.create_user("member@example.com", "member@example.com")
+        UserProfile.objects.filter(user=self.user).update(scheme=scheme)
+        generate_monthly_entries()
+        mark_paid([(self.user.id, current_month())])
+
+    def test_delete_member_with_ledger_rows(self):
+        self.assertTrue(MonthlyCharge.objects.filter(user=self.user).exists())
+        self.assertTrue(MonthlyReward.objects.filter(user=self.user).exists())
+        self.assertTrue(MemberLedgerSummary.objects.filter(user=self.user).exists())
+
+        self.user.delete()
+        # Foreign keys are only checked at commit, which a TestCase never reaches
+        connection.check_constraints()
+
+        self.assertFalse(MonthlyCharge.objects.filter(user_id=self.user.id).exists())
+        self.assertFalse(MemberLedgerSummary.objects.filter(user_id=self.user.id).exists())
+
+    def test_delete_charge_keeps_summary_in_step(self):
+        MonthlyCharge.objects.filter(user=self.user).delete()
+        connection.check_constraints()
+
+        summary = MemberLedgerSummary.objects.get(user=self.user)
+        self.assertEqual(summary.months_paid, 0)
+        self.assertEqual(summary.months_pending, 0)
+
+
+class PendingTotalsTests(TestCase):
+    def test_summary_rollups_and_arrears_agree(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        for i in range(3):
+            user = User.objects.create_user(f"member{i}@example.com", f"member{i}@example.com")
+            UserProfile.objects.filter(user=user).update(scheme=scheme)
+        generate_monthly_entries()
+        mark_paid([(user.id, current_month())])
+
+        arrears = Arrears(12)
+        summaries = MemberLedgerSummary.objects.values_list("months_pending", flat=True)
+        rollup = SchemeMonthlyRollup.objects.get(scheme=scheme, month=current_month())
+
+        self.assertEqual(sum(arrears.pending), 2)
+        self.assertEqual(sum(summaries), 2)
+        self.assertEqual(rollup.pending_count, 2)
+        self.assertEqual(sum(arrears.owed), rollup.pending_amount)
+
+
+class GenerateMonthlyEntriesTests(TestCase):
+    def test_counts_only_rows_this_run_inserted(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        users = [
+            User.objects.create_user(f"member{i}@example.com", f"member{i}@example.com")
+            for i in range(3)
+        ]
+        UserProfile.objects.filter(user__in=users).update(scheme=scheme)
+        MonthlyCharge.objects.create(user=users[0], charge_month=current_month(), paid=False)
+
+        first = generate_monthly_entries()
+        second = generate_monthly_entries()
+
+        self.assertEqual((first["charges"], first["skipped"]), (2, 1))
+        self.assertEqual((second["inserted"], second["skipped"]), (0, 3))
+        self.assertEqual(MonthlyCharge.objects.count(), 3)
+
+
+class LoginFailureCacheTests(TestCase):
+    def test_new_password_works_right_after_reset(self):
+        user = User.objects.create_user("Member", "member@example.com", "old-password")
+        self.assertIsNone(authenticate(username="member@example.com", password="new-password"))
+        self.assertIsNone(authenticate(username="MEMBER", password="new-password"))
+
+        user.set_password("new-password")
+        user.save()
+
+        self.assertEqual(authenticate(username="member@example.com", password="new-password"), user)
+        self.assertEqual(authenticate(username="member", password="new-password"), user)
+
+
+class ProfileChangeTrackingTests(TestCase):
+    def setUp(self):
+        self.scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        self.user = User.objects.create_user("member@example.com", "member@example.com")
+
+    def test_only_and_defer(self):
+        profile = UserProfile.objects.only("member_id").get(user=self.user)
+        self.assertEqual(profile.changed_fields(), [])
+        self.assertEqual(profile.scheme_id, None)
+
+        profile = UserProfile.objects.defer("scheme").get(user=self.user)
+        profile.refresh_from_db(fields=["scheme"])
+        self.assertEqual(profile.changed_fields(), [])
+
+    def test_assigning_a_deferred_field_counts_as_a_change(self):
+        profile = UserProfile.objects.defer("scheme").get(user=self.user)
+        profile.scheme = self.scheme
+        self.assertEqual(profile.changed_fields(), ["scheme_id"])
+        self.assertIsNone(profile.saved_value("scheme_id"))
+
+
+class SchemeListETagTests(TestCase):
+    @override_settings(SCHEME_CATALOG_MAX_AGE=0)
+    def test_etag_follows_the_schemes_not_the_cache_token(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        etag = self.client.get("/schemes/")["ETag"]
+        self.assertEqual(self.client.get("/schemes/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Another process with its own cache loads the same rows
+        app_cache._catalog.update(version=None, loaded_at=None)
+        self.assertEqual(self.client.get("/schemes/")["ETag"], etag)
+
+        # An edit that never touches this process's cache token
+        Scheme.objects.filter(pk=scheme.pk).update(amount=15000)
+        response = self.client.get("/schemes/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "15000")
+
+
+class ReconcileStatementTests(TestCase):
+    def test_member_without_scheme_is_rejected(self):
+        user = User.objects.create_user("member@example.com", "member@example.com")
+        rejects = RejectPreview()
+
+        totals = reconcile_statement(
+            [f"{user.userprofile.member_id},{current_month():%Y-%m},1000"], rejects=rejects
+        )
+
+        self.assertEqual((totals["rejected"], totals["skipped"]), (1, 0))
+        self.assertEqual(rejects.rows[0][-1], "member has no scheme")
+        self.assertFalse(MonthlyCharge.objects.filter(user=user).exists())
+
+
+class PrimaryPinTests(TestCase):
+    def setUp(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        self.member = User.objects.create_user("member@example.com", "member@example.com")
+        UserProfile.objects.filter(user=self.member).update(scheme=scheme)
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin)
+
+    def test_write_on_get_pins_to_primary(self):
+        self.client.get(f"/admin/mark-paid/{self.member.id}/")
+        self.assertIn(PIN_SESSION_KEY, self.client.session)
+
+    def test_read_does_not_pin(self):
+        self.client.get("/admin-dashboard/")
+        self.assertNotIn(PIN_SESSION_KEY, self.client.session)
+
+
+class QueryPlanTests(TestCase):
+    def test_key_queries_use_an_index(self):
+        for name, queryset, ordered in checked_queries():
+            with self.subTest(name):
+                plan, scans, sorts = plan_problems(name, queryset, ordered)
+                self.assertEqual(scans, [], plan)
+                self.assertFalse(sorts, plan)
+
+
+class QueryBudgetTests(TransactionTestCase):
+    # Reports read from the replica alias; a TestCase's open transaction
+    # would keep the mirrored SQLite tables locked
+    databases = {"default", "reporting"}
+
+    def setUp(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        for i in range(12):
+            user = User.objects.create_user(f"member{i}@example.com", f"member{i}@example.com")
+            UserProfile.objects.filter(user=user).update(scheme=scheme)
+        generate_monthly_entries()
+        mark_paid([(user.id, current_month())])
+
+        self.member = self.client_class()
+        self.member.force_login(user)
+        admin = User.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client.force_login(admin)
+        self.member_id = user.userprofile.member_id
+
+    # Budgets hold however many members there are: twelve is past the
+    # repeat threshold, so a per-member query fails the assertion too
+    def test_member_dashboard(self):
+        assert_query_budget("user_dashboard", 3, client=self.member)
+
+    def test_admin_changelist(self):
+        assert_query_budget("/admin/auth/user/", 6, client=self.client)
+
+    def test_members_summary(self):
+        assert_query_budget("admin_members_summary", 4, client=self.client)
+        assert_query_budget(
+            "admin_member_summary_single", 3, client=self.client, args=[self.member_id]
+        )
+
+    def test_exports(self):
+        assert_query_budget("export_members_summary_csv", 3, client=self.client)
+        assert_query_budget("export_members_csv", 3, client=self.client)
+        assert_query_budget("export_arrears_csv", 4, client=self.client)
+        assert_query_budget(
+            "export_member_single_csv", 3, client=self.client, args=[self.member_id]
+        )
+
+
+class SchedulerHandoverTests(TestCase):
+    def test_lost_lease_is_not_a_failed_attempt(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        for i in range(6):
+            user = User.objects.create_user(f"member{i}@example.com", f"member{i}@example.com")
+            UserProfile.objects.filter(user=user).update(scheme=scheme)
+        month = current_month()
+
+        self.assertTrue(acquire_lease("first"))
+        with mock.patch("app.scheduler.acquire_lease", return_value=False):
+            with self.assertRaises(LeaseLost):
+                run_month(month, "first", shard_size=2)
+
+        self.assertEqual(SchedulerRun.objects.get().status, SchedulerRun.ABANDONED)
+        self.assertIsNone(retry_at(month))
+
+        # The lease lapses and the next scheduler resumes the month at once
+        SchedulerLease.objects.update(expires_at=timezone.now())
+        with mock.patch("app.scheduler.due_months", return_value=[month]):
+            runs = tick("second", shard_size=2)
+
+        self.assertEqual([run.status for run in runs], [SchedulerRun.DONE])
+        self.assertEqual(MonthlyCharge.objects.filter(charge_month=month).count(), 6)
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        for i in range(3):
+            EmailOutbox.objects.create(
+                to_email=f"member{i}@example.com", subject="Hello", body="Body"
+            )
+
+    def test_claim_and_send(self):
+        call_command("sendoutbox", stdout=open(os.devnull, "w"))
+
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f"member{i}@example.com" for i in range(3)],
+        )
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.SENT).count(), 3)
+
+    def test_retry_after_backend_error(self):
+        connection = get_connection()
+        with mock.patch.object(connection, "send_messages", side_effect=OSError("SMTP down")):
+            result = send_outbox_batch(connection)
+        self.assertEqual((result["sent"], result["retried"]), (0, 3))
+
+        message = EmailOutbox.objects.first()
+        self.assertEqual((message.status, message.attempts), (EmailOutbox.PENDING, 1))
+        self.assertEqual(message.last_error, "SMTP down")
+        self.assertGreater(message.next_attempt_at, timezone.now())
+        # Backing off: nothing is due yet
+        self.assertEqual(send_outbox_batch(connection)["sent"], 0)
+
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(send_outbox_batch(connection)["sent"], 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(EmailOutbox.objects.get(pk=message.pk).attempts, 2)
+
+    def test_overlapping_batches_send_each_message_once(self):
+        first, second = get_connection(), get_connection()
+        send_messages = first.send_messages
+        overlapped = []
+
+        def send_while_another_batch_runs(messages):
+            if not overlapped:
+                overlapped.append(send_outbox_batch(second))
+            return send_messages(messages)
+
+        with mock.patch.object(first, "send_messages", side_effect=send_while_another_batch_runs):
+            result = send_outbox_batch(first)
+
+        self.assertEqual((result["sent"], overlapped[0]["sent"]), (3, 0))
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class RollupMaintenanceTests(TestCase):
+    def setUp(self):
+        scheme = Scheme.objects.create(
+            name="Gold", amount=12000, monthly_charge=1000, monthly_reward_text="Gold gift"
+        )
+        self.users = []
+        for i in range(2):
+            user = User.objects.create_user(f"member{i}@example.com", f"member{i}@example.com")
+            UserProfile.objects.filter(user=user).update(scheme=scheme)
+            self.users.append(user)
+
+    def assertMatchesRebuild(self):
+        def cells():
+            return sorted(SchemeMonthlyRollup.objects.values_list(
+                "scheme_id", "month", "expected_count", "collected_count", "pending_amount"
+            ))
+        maintained = cells()
+        refresh_scheme_rollups()
+        self.assertEqual(maintained, cells())
+
+    def test_moving_the_only_charge_of_a_month(self):
+        charge = MonthlyCharge(user=self.users[0], charge_month=date(2020, 1, 1))
+        save_charge(charge)
+        charge.charge_month = date(2020, 2, 1)
+        save_charge(charge)
+
+        self.assertFalse(SchemeMonthlyRollup.objects.filter(month=date(2020, 1, 1)).exists())
+        self.assertMatchesRebuild()
+
+    def test_deleting_the_only_member_billed(self):
+        save_charge(MonthlyCharge(user=self.users[0], charge_month=date(2020, 1, 1), paid=True))
+        self.users[0].delete()
+
+        self.assertFalse(SchemeMonthlyRollup.objects.exists())
+        self.assertMatchesRebuild()
+
+
+class MemberIdAllocatorTests(TestCase):
+    def test_one_reservation_serves_a_transaction(self):
+        allocator = MemberIdAllocator("test", transaction_block_size=10)
+        with transaction.atomic():
+            member_ids = [allocator.allocate()[0] for _ in range(10)]
+
+        self.assertEqual(len(set(member_ids)), 10)
+        self.assertEqual(MemberIdSequence.objects.get(name="test").next_value, 10)
+
+    def test_rolled_back_reservation_is_not_kept(self):
+        allocator = MemberIdAllocator("test", transaction_block_size=10)
+        with transaction.atomic():
+            rolled_back = allocator.allocate(2)
+            transaction.set_rollback(True)
+
+        # The sequence was rewound, so the same ids are reserved afresh and
+        # the ones still held from the rolled-back block must be gone
+        with transaction.atomic():
+            member_ids = allocator.allocate(10)
+        self.assertEqual(member_ids[:2], rolled_back)
+        self.assertEqual(len(set(member_ids)), 10)
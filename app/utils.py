@@ -1,46 +1,1401 @@
-import datetime
-from django.utils import timezone
+import base64
+import csv
+import json
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
-from app.models import UserProfile, MonthlyCharge, MonthlyReward
+from django.core.mail import EmailMessage
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from app.cache import get_scheme, invalidate_member_pages, scheme_catalog
+from app.member_ids import allocate_member_ids
+from app.models import (
+    EmailOutbox,
+    Scheme,
+    UserProfile,
+    MonthlyCharge,
+    MonthlyReward,
+    MonthlyJob,
+    MonthlyRunShard,
+    MemberLedgerSummary,
+    SchemeMonthlyRollup,
+)
 
 
-def generate_monthly_entries():
-    today = timezone.now()
-    month_str = today.strftime("%Y-%m")   # Format: 2025-02
+BULK_BATCH_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+LEDGER_PAGE_SIZE = 50
+LEDGER_SUMMARY_FIELDS = [
+    "months_paid",
+    "months_pending",
+    "rewards_received",
+    "last_paid_month",
+    "last_reward_month",
+]
+# What "pending" means: a month billed to a member (a MonthlyCharge
+# exists) and not paid yet. The ledger summary, the scheme rollups, the
+# member pages, the admin changelist and the arrears report all count it
+# this way, so their totals agree.
+PENDING_CHARGE = Q(paid=False)
 
-    for user in User.objects.all():
-        try:
-            profile = UserProfile.objects.get(user=user)
-        except UserProfile.DoesNotExist:
+
+def current_month():
+    return timezone.localdate().replace(day=1)
+
+
+def _user_range(queryset, user_id_range):
+    if user_id_range is None:
+        return queryset
+    start_id, end_id = user_id_range
+    return queryset.filter(user_id__gte=start_id, user_id__lt=end_id)
+
+
+class LedgerWriteTooLong(RuntimeError):
+    """A ledger transaction ran too long for the delta export to see it."""
+
+
+@contextmanager
+def ledger_transaction():
+    """
+    transaction.atomic() for bulk writes to MonthlyCharge/MonthlyReward.
+
+    Their rows are stamped with updated_at as they are written but only
+    become visible at commit; the delta export (see below) assumes that
+    happens within DELTA_EXPORT_LAG_SECONDS. A write that has taken more
+    than half of that by the time it would commit is rolled back with
+    LedgerWriteTooLong instead, so it fails loudly rather than being
+    missed by an export. Split such work into smaller batches or shards.
+    Only time holding the write lock counts: the clock starts once BEGIN
+    IMMEDIATE has taken it, not while waiting for it.
+    """
+    with transaction.atomic():
+        started = time.monotonic()
+        yield
+        elapsed = time.monotonic() - started
+        if elapsed > settings.DELTA_EXPORT_LAG_SECONDS / 2:
+            raise LedgerWriteTooLong(
+                f"ledger transaction took {elapsed:.0f}s; the delta export only allows "
+                f"{settings.DELTA_EXPORT_LAG_SECONDS / 2:.0f}s, use smaller batches"
+            )
+
+
+def _insert_missing(model, objs, month_field, month, batch_size=BULK_BATCH_SIZE):
+    """
+    bulk_create `objs`, which are (user, month) keys read as missing
+    earlier in the same ledger_transaction, and return how many rows that
+    added. BEGIN IMMEDIATE holds the write lock from the first read, so no
+    one else can add the month's rows in between and every key goes in; a
+    before/after count() checks that rather than trusting it, and a
+    shortfall rolls the whole run back instead of miscounting it.
+    """
+    rows = model.objects.filter(**{month_field: month})
+    before = rows.count()
+    model.objects.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+    inserted = rows.count() - before
+    if inserted != len(objs):
+        raise RuntimeError(
+            f"{model._meta.label}: {len(objs) - inserted} of {len(objs)} rows for "
+            f"{month} were written by someone else inside this transaction"
+        )
+    return inserted
+
+
+def generate_monthly_entries(month=None, batch_size=BULK_BATCH_SIZE, user_id_range=None):
+    """
+    Bill every member with a scheme for `month` (defaults to this month).
+
+    Works on whole sets instead of one member at a time: one query for the
+    eligible profiles, one per ledger table for what already exists, and
+    batched inserts for the rest. The (user, month) unique constraints make
+    a rerun for the same month a no-op, and the counts returned (and the
+    summaries and rollups updated) cover only rows this call inserted: a
+    concurrent run waits on the write lock and then finds them billed.
+
+    `user_id_range` is an optional half-open (start_id, end_id) pair that
+    limits the run to one shard of the member id space.
+    """
+    month = (month or current_month()).replace(day=1)
+
+    with ledger_transaction():
+        # Members with a scheme -> that scheme
+        eligible = dict(
+            _user_range(
+                UserProfile.objects.filter(scheme__isnull=False), user_id_range
+            ).values_list("user_id", "scheme_id")
+        )
+        schemes = scheme_catalog(require=set(eligible.values()))
+
+        # Charges already billed for this month
+        billed = {}
+        for user_id, paid in _user_range(
+            MonthlyCharge.objects.filter(charge_month=month), user_id_range
+        ).values_list("user_id", "paid"):
+            billed[user_id] = paid
+
+        rewarded = set(
+            _user_range(MonthlyReward.objects.filter(reward_month=month), user_id_range)
+            .values_list("user_id", flat=True)
+        )
+
+        # New pending charges
+        new_charges = [
+            MonthlyCharge(user_id=user_id, charge_month=month, paid=False)
+            for user_id in eligible
+            if user_id not in billed
+        ]
+
+        # Paid charges that never got their reward
+        new_rewards = [
+            MonthlyReward(
+                user_id=user_id,
+                reward_month=month,
+                reward_text=schemes[eligible[user_id]].monthly_reward_text,
+            )
+            for user_id, paid in billed.items()
+            if paid and user_id in eligible and user_id not in rewarded
+        ]
+
+        _insert_missing(MonthlyCharge, new_charges, "charge_month", month, batch_size)
+        _insert_missing(MonthlyReward, new_rewards, "reward_month", month, batch_size)
+
+        refresh_ledger_summaries(
+            [c.user_id for c in new_charges] + [r.user_id for r in new_rewards]
+        )
+
+        per_scheme = Counter(eligible[charge.user_id] for charge in new_charges)
+        bump_scheme_rollups({
+            (scheme_id, month): (count, 0) for scheme_id, count in per_scheme.items()
+        })
+
+    return {
+        "month": month,
+        "charges": len(new_charges),
+        "rewards": len(new_rewards),
+        "inserted": len(new_charges) + len(new_rewards),
+        "skipped": len(eligible) - len(new_charges),
+    }
+
+
+def compute_ledger_summaries(user_ids):
+    """
+    Build (unsaved) MemberLedgerSummary rows for `user_ids` from the raw
+    ledger with one grouped query per table.
+    """
+    summaries = {
+        user_id: MemberLedgerSummary(user_id=user_id) for user_id in user_ids
+    }
+    if not summaries:
+        return summaries
+
+    for row in (
+        MonthlyCharge.objects.filter(user_id__in=summaries)
+        .values("user_id")
+        .annotate(
+            paid_count=Count("id", filter=Q(paid=True)),
+            pending_count=Count("id", filter=PENDING_CHARGE),
+            last_paid=Max("charge_month", filter=Q(paid=True)),
+        )
+        .order_by()
+    ):
+        summary = summaries[row["user_id"]]
+        summary.months_paid = row["paid_count"]
+        summary.months_pending = row["pending_count"]
+        summary.last_paid_month = row["last_paid"]
+
+    for row in (
+        MonthlyReward.objects.filter(user_id__in=summaries)
+        .values("user_id")
+        .annotate(received=Count("id"), last=Max("reward_month"))
+        .order_by()
+    ):
+        summary = summaries[row["user_id"]]
+        summary.rewards_received = row["received"]
+        summary.last_reward_month = row["last"]
+
+    return summaries
+
+
+def refresh_ledger_summaries(user_ids, batch_size=BULK_BATCH_SIZE):
+    """
+    Recompute the ledger summary of every member in `user_ids`.
+
+    Call this inside the transaction that wrote their charges or rewards so
+    the summary commits (or rolls back) together with the ledger. It also
+    drops the members' cached pages, since bulk writes send no signals.
+    """
+    user_ids = sorted(set(user_ids))
+    invalidate_member_pages(user_ids)
+
+    with transaction.atomic():
+        for i in range(0, len(user_ids), batch_size):
+            summaries = compute_ledger_summaries(user_ids[i:i + batch_size])
+            MemberLedgerSummary.objects.bulk_create(
+                summaries.values(),
+                update_conflicts=True,
+                unique_fields=["user"],
+                update_fields=LEDGER_SUMMARY_FIELDS + ["updated_at"],
+            )
+
+
+def ledger_summary_drift(batch_size=BULK_BATCH_SIZE):
+    """
+    Yield the ids of members whose stored summary differs from the ledger.
+    A member with ledger rows but no summary counts as drifted.
+    """
+    user_ids = list(User.objects.order_by("id").values_list("id", flat=True))
+
+    for i in range(0, len(user_ids), batch_size):
+        expected = compute_ledger_summaries(user_ids[i:i + batch_size])
+        stored = MemberLedgerSummary.objects.in_bulk(list(expected))
+
+        for user_id, summary in expected.items():
+            current = stored.get(user_id, MemberLedgerSummary(user_id=user_id))
+            if any(
+                getattr(summary, field) != getattr(current, field)
+                for field in LEDGER_SUMMARY_FIELDS
+            ):
+                yield user_id
+
+
+# --------------------------
+# Scheme monthly rollups
+# --------------------------
+def _scheme_prices(scheme_ids=None):
+    # Read fresh rather than from the catalog, which only reloads once the
+    # transaction that changed a scheme has committed
+    schemes = Scheme.objects.all()
+    if scheme_ids is not None:
+        schemes = schemes.filter(id__in=scheme_ids)
+    return dict(schemes.values_list("id", "monthly_charge"))
+
+
+def _rollup_amounts(price, expected, collected):
+    pending = expected - collected
+    return {
+        "expected_count": expected,
+        "collected_count": collected,
+        "pending_count": pending,
+        "expected_amount": expected * price,
+        "collected_amount": collected * price,
+        "pending_amount": pending * price,
+    }
+
+
+def bump_scheme_rollups(deltas):
+    """
+    Add `deltas`, {(scheme_id, month): (charges billed, charges paid)}, to
+    the rollup cells, creating missing ones and deleting ones left without
+    charges, as refresh_scheme_rollups would. Call it in the transaction
+    that wrote the charges. Costs one UPDATE per cell touched, however many
+    charges changed.
+    """
+    deltas = {cell: delta for cell, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+
+    prices = _scheme_prices({scheme_id for scheme_id, month in deltas})
+    SchemeMonthlyRollup.objects.bulk_create(
+        [SchemeMonthlyRollup(scheme_id=scheme_id, month=month) for scheme_id, month in deltas],
+        ignore_conflicts=True,
+    )
+    now = timezone.now()
+    for (scheme_id, month), (expected, collected) in deltas.items():
+        changes = _rollup_amounts(prices[scheme_id], expected, collected)
+        SchemeMonthlyRollup.objects.filter(scheme_id=scheme_id, month=month).update(
+            updated_at=now,
+            **{field: F(field) + value for field, value in changes.items()},
+        )
+
+    shrunk = [cell for cell, (expected, collected) in deltas.items() if expected < 0]
+    if shrunk:
+        SchemeMonthlyRollup.objects.filter(
+            expected_count__lte=0,
+            scheme_id__in={scheme_id for scheme_id, month in shrunk},
+            month__in={month for scheme_id, month in shrunk},
+        ).delete()
+
+
+def charge_rollup_deltas(changes):
+    """
+    Rollup deltas for charges entering or leaving the ledger, from
+    `changes` as (sign, user_id, month, paid) with sign 1 or -1. Charges
+    of members without a scheme are not in the rollup.
+    """
+    user_schemes = dict(
+        UserProfile.objects.filter(
+            user_id__in={user_id for sign, user_id, month, paid in changes},
+            scheme__isnull=False,
+        ).values_list("user_id", "scheme_id")
+    )
+    deltas = {}
+    for sign, user_id, month, paid in changes:
+        scheme_id = user_schemes.get(user_id)
+        if scheme_id is None:
+            continue
+        expected, collected = deltas.get((scheme_id, month), (0, 0))
+        deltas[(scheme_id, month)] = (expected + sign, collected + sign * bool(paid))
+    return deltas
+
+
+def refresh_scheme_rollups(months=None, scheme_ids=None, batch_size=BULK_BATCH_SIZE):
+    """
+    Recount rollup cells from MonthlyCharge: every cell of `months` (all
+    months when None), limited to `scheme_ids` when given. Used where a
+    delta is not known: scheme moves and full rebuilds.
+    """
+    charges = MonthlyCharge.objects.filter(user__userprofile__scheme__isnull=False)
+    rollups = SchemeMonthlyRollup.objects.all()
+    if months is not None:
+        months = {month.replace(day=1) for month in months}
+        charges = charges.filter(charge_month__in=months)
+        rollups = rollups.filter(month__in=months)
+    if scheme_ids is not None:
+        charges = charges.filter(user__userprofile__scheme_id__in=scheme_ids)
+        rollups = rollups.filter(scheme_id__in=scheme_ids)
+
+    prices = _scheme_prices(scheme_ids)
+    counts = (
+        charges.values("user__userprofile__scheme_id", "charge_month")
+        .annotate(expected=Count("id"), collected=Count("id", filter=Q(paid=True)))
+        .order_by()
+    )
+
+    with transaction.atomic():
+        rollups.delete()
+        SchemeMonthlyRollup.objects.bulk_create(
+            [
+                SchemeMonthlyRollup(
+                    scheme_id=row["user__userprofile__scheme_id"],
+                    month=row["charge_month"],
+                    **_rollup_amounts(
+                        prices[row["user__userprofile__scheme_id"]],
+                        row["expected"],
+                        row["collected"],
+                    ),
+                )
+                for row in counts
+            ],
+            batch_size=batch_size,
+        )
+
+
+ROLLUP_FIELDS = [
+    "expected_count", "collected_count", "pending_count",
+    "expected_amount", "collected_amount", "pending_amount",
+]
+
+
+def scheme_rollup_report(first_month, last_month, scheme_id=None):
+    """
+    Rollup cells from `first_month` to `last_month` (inclusive), newest
+    month first, as {month: {"schemes": [cells], "total": {...}}}. Reads
+    only the rollup table.
+    """
+    cells = SchemeMonthlyRollup.objects.filter(month__gte=first_month, month__lte=last_month)
+    if scheme_id is not None:
+        cells = cells.filter(scheme_id=scheme_id)
+
+    schemes = scheme_catalog()
+    report = {}
+    for cell in cells.order_by("-month", "scheme_id").values("scheme_id", "month", *ROLLUP_FIELDS):
+        month = report.setdefault(
+            cell["month"], {"schemes": [], "total": dict.fromkeys(ROLLUP_FIELDS, 0)}
+        )
+        scheme = schemes.get(cell["scheme_id"])
+        month["schemes"].append({**cell, "scheme": scheme.name if scheme else ""})
+        for field in ROLLUP_FIELDS:
+            month["total"][field] += cell[field]
+    return report
+
+
+def rollup_month_totals(months):
+    """Summed rollup figures per month for `months`, zeros where nothing was billed."""
+    totals = {month: dict.fromkeys(ROLLUP_FIELDS, 0) for month in months}
+    for row in (
+        SchemeMonthlyRollup.objects.filter(month__in=months)
+        .values("month")
+        .annotate(**{field: Sum(field) for field in ROLLUP_FIELDS})
+        .order_by()
+    ):
+        totals[row.pop("month")] = row
+    return totals
+
+
+def reprice_scheme_rollups(scheme):
+    """Recompute the amounts of `scheme`'s cells after its monthly_charge changed."""
+    SchemeMonthlyRollup.objects.filter(scheme=scheme).update(
+        expected_amount=F("expected_count") * scheme.monthly_charge,
+        collected_amount=F("collected_count") * scheme.monthly_charge,
+        pending_amount=F("pending_count") * scheme.monthly_charge,
+        updated_at=timezone.now(),
+    )
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def mark_paid(entries, batch_size=BULK_BATCH_SIZE):
+    """
+    Mark (user_id, month) pairs paid and give each member their reward.
+
+    Per month, charges that exist unpaid are flipped with one UPDATE per
+    batch, missing charges are inserted already paid, and rewards are
+    upserted with bulk_create(update_conflicts=True). Everything, including
+    the ledger summaries, commits in one transaction.
+
+    Only members with a scheme are billed: pairs for anyone else (staff,
+    members not yet on a scheme) are left alone and counted as skipped.
+
+    Returns counts of charges created, updated (were pending) and skipped
+    (already paid, or no scheme), plus the rewards written.
+    """
+    by_month = {}
+    seen = 0
+    for user_id, month in entries:
+        by_month.setdefault(month.replace(day=1), set()).add(user_id)
+        seen += 1
+
+    # Repeats of the same (user, month) count as skipped
+    unique = sum(len(user_ids) for user_ids in by_month.values())
+    result = {"created": 0, "updated": 0, "skipped": seen - unique, "rewards": 0}
+    if not by_month:
+        return result
+
+    all_users = set().union(*by_month.values())
+
+    with ledger_transaction():
+        user_schemes = {}
+        for chunk in _chunks(all_users, batch_size):
+            user_schemes.update(
+                UserProfile.objects.filter(
+                    user_id__in=chunk, scheme__isnull=False
+                ).values_list("user_id", "scheme_id")
+            )
+        schemes = scheme_catalog(require=set(user_schemes.values()))
+        rollup_deltas = {}
+
+        for month, user_ids in by_month.items():
+            billable = user_ids & user_schemes.keys()
+            result["skipped"] += len(user_ids) - len(billable)
+            for chunk in _chunks(sorted(billable), batch_size):
+                existing = dict(
+                    MonthlyCharge.objects.filter(charge_month=month, user_id__in=chunk)
+                    .values_list("user_id", "paid")
+                )
+
+                result["skipped"] += sum(1 for paid in existing.values() if paid)
+                result["updated"] += MonthlyCharge.objects.filter(
+                    charge_month=month, user_id__in=chunk, paid=False
+                ).update(paid=True, updated_at=timezone.now())
+
+                missing = [
+                    MonthlyCharge(user_id=user_id, charge_month=month, paid=True)
+                    for user_id in chunk
+                    if user_id not in existing
+                ]
+                MonthlyCharge.objects.bulk_create(
+                    missing,
+                    update_conflicts=True,
+                    unique_fields=["user", "charge_month"],
+                    update_fields=["paid", "updated_at"],
+                )
+                result["created"] += len(missing)
+
+                # Pending charges now paid are collected; new ones are also billed
+                for user_id in chunk:
+                    if existing.get(user_id):
+                        continue
+                    cell = (user_schemes[user_id], month)
+                    expected, collected = rollup_deltas.get(cell, (0, 0))
+                    rollup_deltas[cell] = (expected + (user_id not in existing), collected + 1)
+
+                rewards = [
+                    MonthlyReward(
+                        user_id=user_id,
+                        reward_month=month,
+                        reward_text=schemes[user_schemes[user_id]].monthly_reward_text,
+                    )
+                    for user_id in chunk
+                ]
+                MonthlyReward.objects.bulk_create(
+                    rewards,
+                    update_conflicts=True,
+                    unique_fields=["user", "reward_month"],
+                    update_fields=["reward_text", "updated_at"],
+                )
+                result["rewards"] += len(rewards)
+
+        refresh_ledger_summaries(user_schemes.keys())
+        bump_scheme_rollups(rollup_deltas)
+
+    return result
+
+
+def bulk_mark_paid(month=None, member_ids=(), charge_ids=()):
+    """
+    Resolve member ids (for `month`) and/or charge ids to (user, month)
+    pairs and mark them paid. Ids that match nothing are reported as
+    `unmatched`.
+    """
+    month = (month or current_month()).replace(day=1)
+    entries = []
+    unmatched = []
+
+    member_ids = set(member_ids)
+    if member_ids:
+        found = {}
+        for chunk in _chunks(member_ids, BULK_BATCH_SIZE):
+            found.update(
+                UserProfile.objects.filter(member_id__in=chunk)
+                .values_list("member_id", "user_id")
+            )
+        entries += [(user_id, month) for user_id in found.values()]
+        unmatched += sorted(member_ids - set(found))
+
+    charge_ids = set(charge_ids)
+    if charge_ids:
+        found = {}
+        for chunk in _chunks(charge_ids, BULK_BATCH_SIZE):
+            found.update(
+                (charge_id, (user_id, charge_month))
+                for charge_id, user_id, charge_month in MonthlyCharge.objects.filter(
+                    id__in=chunk
+                ).values_list("id", "user_id", "charge_month")
+            )
+        entries += found.values()
+        unmatched += sorted(charge_ids - set(found))
+
+    result = mark_paid(entries)
+    result["unmatched"] = unmatched
+    return result
+
+
+STATEMENT_HEADER = ["member_id", "month", "amount"]
+
+
+def _parse_statement_month(value):
+    # YYYY-MM or YYYY-MM-DD; sliced by hand since strptime is slow per line
+    value = value.strip()
+    if len(value) not in (7, 10) or value[4] != "-":
+        return None
+    try:
+        return date(int(value[:4]), int(value[5:7]), 1)
+    except ValueError:
+        return None
+
+
+def reconcile_statement(lines, rejects=None, batch_size=10000):
+    """
+    Apply a bank statement of payments to the ledger.
+
+    `lines` is any iterable of CSV text lines with the columns member_id,
+    month (YYYY-MM or YYYY-MM-DD) and an optional amount; a header row is
+    skipped. The file is read in batches: each batch resolves its member
+    ids with one query and goes through mark_paid in its own transaction,
+    so memory stays bounded however long the statement is.
+
+    Lines that cannot be applied are written to the csv writer `rejects`
+    with the reason appended. Returns the summed mark_paid counts plus the
+    number of lines read and rejected.
+    """
+    totals = {"lines": 0, "rejected": 0, "created": 0, "updated": 0, "skipped": 0, "rewards": 0}
+
+    def reject(row, reason):
+        totals["rejected"] += 1
+        if rejects is not None:
+            rejects.writerow(list(row) + [reason])
+
+    def flush(batch):
+        members = {}
+        member_ids = {row[0].strip() for row, month in batch}
+        for chunk in _chunks(member_ids, BULK_BATCH_SIZE):
+            members.update(
+                (member_id, (user_id, get_scheme(scheme_id)))
+                for member_id, user_id, scheme_id in UserProfile.objects.filter(
+                    member_id__in=chunk
+                ).values_list("member_id", "user_id", "scheme_id")
+            )
+
+        entries = []
+        for row, month in batch:
+            member = members.get(row[0].strip())
+            if member is None:
+                reject(row, "unknown member id")
+                continue
+
+            user_id, scheme = member
+            if scheme is None:
+                # mark_paid would only skip it; the payment still needs a home
+                reject(row, "member has no scheme")
+                continue
+
+            amount = row[2].strip() if len(row) > 2 else ""
+            if amount:
+                try:
+                    if float(amount) < scheme.monthly_charge:
+                        reject(row, f"amount below monthly charge of {scheme.monthly_charge}")
+                        continue
+                except ValueError:
+                    reject(row, "amount is not a number")
+                    continue
+
+            entries.append((user_id, month))
+
+        for key, value in mark_paid(entries).items():
+            totals[key] += value
+
+    batch = []
+    for number, row in enumerate(csv.reader(lines)):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if number == 0 and row[0].strip().lower() == STATEMENT_HEADER[0]:
             continue
 
-        scheme = profile.scheme
-        if not scheme:
+        totals["lines"] += 1
+        month = _parse_statement_month(row[1]) if len(row) > 1 else None
+        if month is None:
+            reject(row, "missing or invalid month")
             continue
 
-        # Check if already created for this user & month
-        exists_charge = MonthlyCharge.objects.filter(
-            user=user,
-            month=month_str
-        ).exists()
+        batch.append((row, month))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+
+    return totals
+
+
+class RejectPreview:
+    """
+    csv-writer stand-in that keeps the first `limit` rejected rows for
+    display, and passes every row on to the csv writer `spill` if given.
+    """
+
+    def __init__(self, limit=100, spill=None):
+        self.limit = limit
+        self.rows = []
+        self.spill = spill
+
+    def writerow(self, row):
+        if len(self.rows) < self.limit:
+            self.rows.append(row)
+        if self.spill is not None:
+            self.spill.writerow(row)
+
+
+def save_charge(charge):
+    """Save a single charge; a paid one also gets its reward."""
+    with transaction.atomic():
+        before = None
+        if charge.pk:
+            before = (
+                MonthlyCharge.objects.filter(pk=charge.pk)
+                .values_list("user_id", "charge_month", "paid")
+                .first()
+            )
+        charge.save()
+        if charge.paid:
+            mark_paid([(charge.user_id, charge.charge_month)])
+        refresh_ledger_summaries({charge.user_id} | ({before[0]} if before else set()))
+
+        # Take the charge out of the cell it was in and add it where it is now
+        changes = [(1, charge.user_id, charge.charge_month, charge.paid)]
+        if before:
+            changes.append((-1, *before))
+        bump_scheme_rollups(charge_rollup_deltas(changes))
+
+
+def plan_shards(shard_size):
+    """
+    Split the id space of billable members into half-open ranges.
 
-        if exists_charge:
-            continue  # Avoid duplicates
+    Boundaries are aligned to multiples of `shard_size` so the same size
+    always yields the same shards, which is what lets a run resume.
+    """
+    bounds = UserProfile.objects.filter(scheme__isnull=False).aggregate(
+        lo=Min("user_id"), hi=Max("user_id")
+    )
+    if bounds["lo"] is None:
+        return []
 
-        # Create monthly charge
-        MonthlyCharge.objects.create(
-            user=user,
-            scheme=scheme,
-            month=month_str,
-            charge_amount=scheme.monthly_charge,
-            status="Pending"
+    first = bounds["lo"] // shard_size * shard_size
+    return [
+        (start, start + shard_size)
+        for start in range(first, bounds["hi"] + 1, shard_size)
+    ]
+
+
+def run_monthly_shard(month, start_id, end_id, batch_size=BULK_BATCH_SIZE):
+    """
+    Bill one shard and record its checkpoint in the same transaction, so a
+    shard is either fully done and checkpointed or not at all.
+    """
+    started = time.monotonic()
+    with transaction.atomic():
+        result = generate_monthly_entries(
+            month, batch_size=batch_size, user_id_range=(start_id, end_id)
+        )
+        duration = time.monotonic() - started
+        MonthlyRunShard.objects.update_or_create(
+            month=result["month"],
+            start_id=start_id,
+            end_id=end_id,
+            defaults={
+                "charges": result["charges"],
+                "rewards": result["rewards"],
+                "skipped": result["skipped"],
+                "duration": duration,
+            },
+        )
+
+    result.update(start_id=start_id, end_id=end_id, duration=duration)
+    return result
+
+
+# --------------------------
+# Monthly run jobs
+# --------------------------
+# The dashboard only queues a MonthlyJob; the runjobs worker claims it and
+# bills the month shard by shard through run_monthly_shard, saving the
+# progress counters after every shard. A job whose worker stops sending
+# heartbeats for settings.MONTHLY_JOB_STALE_SECONDS can be claimed again,
+# and picks up after the last shard checkpointed since it was queued.
+
+MONTHLY_JOB_SHARD_SIZE = 5000
+
+
+def enqueue_monthly_job(month=None, user=None):
+    """
+    Queue a monthly run for `month` (defaults to this month). Returns
+    (job, created); when a job for the month is already queued or running
+    that job is returned with created False.
+    """
+    month = (month or current_month()).replace(day=1)
+    while True:
+        try:
+            with transaction.atomic():
+                return MonthlyJob.objects.create(month=month, requested_by=user), True
+        except IntegrityError:
+            # The active job may finish before we read it; then queue again
+            job = MonthlyJob.objects.filter(month=month, status__in=MonthlyJob.ACTIVE).first()
+            if job is not None:
+                return job, False
+
+
+def claim_monthly_job(month=None):
+    """
+    Mark the oldest queued job, or else a running job with a stale
+    heartbeat, as running by this worker and return it; None when idle.
+    `month` limits the choice to that month's job.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.MONTHLY_JOB_STALE_SECONDS)
+    candidates = MonthlyJob.objects.filter(
+        Q(status=MonthlyJob.QUEUED)
+        | Q(status=MonthlyJob.RUNNING, heartbeat_at__lt=stale)
+    ).order_by("created_at", "id")
+    if month is not None:
+        candidates = candidates.filter(month=month)
+
+    for job in candidates[:10]:
+        now = timezone.now()
+        # Compare-and-set on the heartbeat, so two workers never both win
+        claimed = MonthlyJob.objects.filter(
+            pk=job.pk, status=job.status, heartbeat_at=job.heartbeat_at
+        ).update(
+            status=MonthlyJob.RUNNING,
+            started_at=job.started_at or now,
+            heartbeat_at=now,
         )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+class JobTakenOver(Exception):
+    """Raised when another worker has claimed the job this one was running."""
+
+
+def _save_job(job, *fields):
+    """
+    Write `fields` of a running `job` and a new heartbeat, but only if the
+    heartbeat is still the one this worker last wrote. Raises JobTakenOver
+    otherwise, so a worker that went stale never overwrites its successor.
+    """
+    now = timezone.now()
+    saved = MonthlyJob.objects.filter(
+        pk=job.pk, status=MonthlyJob.RUNNING, heartbeat_at=job.heartbeat_at
+    ).update(heartbeat_at=now, **{field: getattr(job, field) for field in fields})
+    if not saved:
+        raise JobTakenOver(f"job #{job.pk} was claimed by another worker")
+    job.heartbeat_at = now
+
+
+def run_monthly_job(job, shard_size=MONTHLY_JOB_SHARD_SIZE, batch_size=BULK_BATCH_SIZE, on_shard=None):
+    """
+    Bill the month of a claimed `job`, updating its progress after every
+    shard and then calling `on_shard(job)` if given. A failure, including
+    one raised by `on_shard`, marks the job failed and is re-raised.
+    Raises JobTakenOver, without touching the job, once another worker
+    has claimed it.
+    """
+    try:
+        shards = plan_shards(shard_size)
+        # Shards checkpointed since the job was queued, by an earlier claim
+        done = {
+            (start_id, end_id): (charges, rewards, skipped)
+            for start_id, end_id, charges, rewards, skipped in MonthlyRunShard.objects.filter(
+                month=job.month, finished_at__gte=job.created_at
+            ).values_list("start_id", "end_id", "charges", "rewards", "skipped")
+        }
+        finished = [done[shard] for shard in shards if shard in done]
+
+        job.members_total = UserProfile.objects.filter(scheme__isnull=False).count()
+        job.shards_total = len(shards)
+        job.shards_done = len(finished)
+        job.members_done = sum(charges + skipped for charges, rewards, skipped in finished)
+        job.inserted = sum(charges + rewards for charges, rewards, skipped in finished)
+        job.skipped = sum(skipped for charges, rewards, skipped in finished)
+        progress = ("shards_done", "members_done", "inserted", "skipped")
+        _save_job(job, "members_total", "shards_total", *progress)
+
+        for start_id, end_id in shards:
+            if (start_id, end_id) in done:
+                continue
+            result = run_monthly_shard(job.month, start_id, end_id, batch_size=batch_size)
+            job.shards_done += 1
+            job.members_done += result["charges"] + result["skipped"]
+            job.inserted += result["inserted"]
+            job.skipped += result["skipped"]
+            _save_job(job, *progress)
+            if on_shard is not None:
+                on_shard(job)
+    except JobTakenOver:
+        raise
+    except Exception as exc:
+        job.status = MonthlyJob.FAILED
+        job.error = repr(exc)
+        job.finished_at = timezone.now()
+        try:
+            # Leave the job to the worker that took it over, if any
+            _save_job(job, "status", "error", "finished_at")
+        except JobTakenOver:
+            pass
+        raise
+
+    job.status = MonthlyJob.DONE
+    job.finished_at = timezone.now()
+    _save_job(job, "status", "finished_at")
+    return job
+
+
+def monthly_job_status(job):
+    """The JSON the dashboard polls for one job."""
+    eta = job.eta_seconds()
+    return {
+        "id": job.id,
+        "month": job.month.strftime("%Y-%m"),
+        "status": job.status,
+        "members_total": job.members_total,
+        "members_done": job.members_done,
+        "shards_total": job.shards_total,
+        "shards_done": job.shards_done,
+        "inserted": job.inserted,
+        "skipped": job.skipped,
+        "eta_seconds": round(eta) if eta is not None else None,
+        "error": job.error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def member_summaries(queryset=None):
+    """
+    Profiles annotated with `charges_paid` and `rewards_received`.
+
+    The counts come from MemberLedgerSummary through a join, so a page of
+    summaries costs one query however many members it holds. Every summary
+    screen and export goes through here so they all show the same numbers.
+    """
+    if queryset is None:
+        queryset = UserProfile.objects.all()
+
+    return queryset.select_related("user").annotate(
+        charges_paid=Coalesce("user__ledger_summary__months_paid", 0),
+        rewards_received=Coalesce("user__ledger_summary__rewards_received", 0),
+    )
+
+
+def last_reward_months(queryset=None):
+    """Profiles annotated with the month of their latest reward."""
+    if queryset is None:
+        queryset = UserProfile.objects.all()
+
+    return queryset.select_related("user").annotate(
+        last_reward_month=F("user__ledger_summary__last_reward_month")
+    )
+
+
+def member_summary_row(profile):
+    user = profile.user
+    scheme = profile.get_scheme()
+    return {
+        "name": f"{user.first_name} {user.last_name}",
+        "member_id": profile.member_id,
+        "scheme": scheme.name if scheme else "",
+        "join_date": user.date_joined.strftime("%Y-%m-%d"),
+        "charges_paid": profile.charges_paid,
+        "rewards_received": profile.rewards_received,
+    }
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_lines(header, rows):
+    """`header` and `rows` as CSV text lines."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_lines(filename, lines, content_type, compress=False):
+    """
+    Stream text `lines` as a download without buffering the file.
+
+    With `compress` the body is gzipped on the fly and sent as a .gz
+    attachment.
+    """
+    if compress:
+        response = StreamingHttpResponse(_gzip_stream(lines), content_type="application/gzip")
+        filename += ".gz"
+    else:
+        response = StreamingHttpResponse(lines, content_type=content_type)
+
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def stream_csv(filename, header, rows, compress=False):
+    """Stream `rows` as a CSV download, see stream_lines."""
+    return stream_lines(filename, csv_lines(header, rows), "text/csv", compress)
+
+
+def wants_gzip(request):
+    return request.GET.get("gzip") in ("1", "true", "yes")
+
+
+def _encode_cursor(direction, month, pk):
+    raw = json.dumps([direction, month.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, month, pk = json.loads(raw)
+        if direction not in ("next", "prev"):
+            return None
+        return direction, date.fromisoformat(month), int(pk)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_query(queryset, month_field, position=None, page_size=LEDGER_PAGE_SIZE):
+    """
+    The range query behind one keyset page: the `page_size + 1` rows of
+    `queryset` past `position`, a decoded (direction, month, id) cursor or
+    None for the first page, in the order they are read.
+
+    The month bound is also stated on its own so the (month, id) index can
+    be walked in order from the cursor, instead of sorting every row
+    before it.
+    """
+    if position is None:
+        return queryset.order_by(f"-{month_field}", "-id")[:page_size + 1]
+
+    direction, month, pk = position
+    if direction == "next":
+        return queryset.filter(
+            Q(**{f"{month_field}__lte": month}),
+            Q(**{f"{month_field}__lt": month}) | Q(id__lt=pk),
+        ).order_by(f"-{month_field}", "-id")[:page_size + 1]
+    return queryset.filter(
+        Q(**{f"{month_field}__gte": month}),
+        Q(**{f"{month_field}__gt": month}) | Q(id__gt=pk),
+    ).order_by(month_field, "id")[:page_size + 1]
+
+
+def keyset_page(queryset, month_field, cursor=None, page_size=LEDGER_PAGE_SIZE):
+    """
+    One page of `queryset`, newest month first, paginated on (month, id).
+
+    `cursor` is an opaque token from a previous page. Every page is a range
+    scan on the index from where the last one stopped, so deep pages cost
+    the same as the first. Returns (rows, next_cursor, prev_cursor); a
+    cursor is None when there is no page in that direction.
+    """
+    position = _decode_cursor(cursor) if cursor else None
+    direction = position[0] if position else "next"
+    rows = list(keyset_query(queryset, month_field, position, page_size))
+
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == "prev":
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    has_next = more if direction == "next" else True
+    has_prev = position is not None if direction == "next" else more
+
+    first, last = rows[0], rows[-1]
+    next_cursor = (
+        _encode_cursor("next", getattr(last, month_field), last.id) if has_next else None
+    )
+    prev_cursor = (
+        _encode_cursor("prev", getattr(first, month_field), first.id) if has_prev else None
+    )
+    return rows, next_cursor, prev_cursor
+
+
+def ledger_filters(request, queryset, month_field):
+    """
+    Narrow a MonthlyCharge/MonthlyReward queryset by the ?month=YYYY-MM,
+    ?scheme=<id> and ?paid=1|0 query parameters. Returns the queryset and
+    the applied filters, ready to carry over into pagination links.
+    """
+    applied = {}
+
+    month = request.GET.get("month")
+    if month:
+        try:
+            queryset = queryset.filter(
+                **{month_field: datetime.strptime(month, "%Y-%m").date()}
+            )
+            applied["month"] = month
+        except ValueError:
+            pass
+
+    scheme = request.GET.get("scheme")
+    if scheme and scheme.isdigit():
+        queryset = queryset.filter(user__userprofile__scheme_id=scheme)
+        applied["scheme"] = scheme
+
+    paid = request.GET.get("paid")
+    if paid in ("1", "0") and month_field == "charge_month":
+        queryset = queryset.filter(paid=paid == "1")
+        applied["paid"] = paid
+
+    return queryset, applied
+
+
+def page_links(filters, next_cursor, prev_cursor):
+    """Query strings for the next/previous page links, keeping the filters."""
+    return {
+        "next_url": f"?{urlencode({**filters, 'cursor': next_cursor})}" if next_cursor else None,
+        "prev_url": f"?{urlencode({**filters, 'cursor': prev_cursor})}" if prev_cursor else None,
+    }
+
+
+OUTBOX_BACKOFF_SECONDS = 30
+OUTBOX_MAX_BACKOFF_SECONDS = 3600
+# A claimed message is hidden from other workers for this long; if its
+# worker dies mid-batch the message becomes due again afterwards
+OUTBOX_CLAIM_SECONDS = 300
+
+
+def _claim_outbox(batch_size, now):
+    """Due messages this worker now owns, claimed one conditional UPDATE each."""
+    candidates = list(
+        EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+        .order_by("next_attempt_at", "id")[:batch_size]
+    )
+    claimed_until = now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+    claimed = []
+    for message in candidates:
+        if EmailOutbox.objects.filter(
+            pk=message.pk,
+            status=EmailOutbox.PENDING,
+            next_attempt_at=message.next_attempt_at,
+        ).update(next_attempt_at=claimed_until):
+            message.next_attempt_at = claimed_until
+            claimed.append(message)
+    return claimed
+
+
+def _reset_connection(connection):
+    """Drop a mail connection that failed and open a fresh one."""
+    try:
+        connection.close()
+    except Exception:
+        pass
+    try:
+        connection.open()
+    except Exception:
+        # The next send tries to open it again and fails on its own
+        pass
+
+
+def send_outbox_batch(connection, batch_size=50, max_attempts=5):
+    """
+    Send up to `batch_size` due outbox messages over one open mail
+    `connection`.
+
+    Messages are claimed before sending, so concurrent workers never send
+    the same one. A send error resets the connection, since the next
+    message would fail on a dead one too. A failed message is retried
+    with exponential backoff until it has been tried `max_attempts` times,
+    then marked failed. Returns the number sent and failed plus the
+    per-message send latencies in seconds.
+    """
+    due = _claim_outbox(batch_size, timezone.now())
+
+    result = {"sent": 0, "failed": 0, "retried": 0, "latencies": []}
+    for message in due:
+        message.attempts += 1
+        started = time.monotonic()
+        try:
+            sent = connection.send_messages([
+                EmailMessage(
+                    subject=message.subject,
+                    body=message.body,
+                    to=[message.to_email],
+                    connection=connection,
+                )
+            ])
+            if not sent:
+                raise RuntimeError("mail connection is not open")
+        except Exception as exc:
+            _reset_connection(connection)
+            message.last_error = str(exc)
+            if message.attempts >= max_attempts:
+                message.status = EmailOutbox.FAILED
+                result["failed"] += 1
+            else:
+                delay = min(
+                    OUTBOX_BACKOFF_SECONDS * 2 ** (message.attempts - 1),
+                    OUTBOX_MAX_BACKOFF_SECONDS,
+                )
+                message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+                result["retried"] += 1
+        else:
+            message.status = EmailOutbox.SENT
+            message.sent_at = timezone.now()
+            message.last_error = ""
+            result["sent"] += 1
+            result["latencies"].append(time.monotonic() - started)
+
+    EmailOutbox.objects.bulk_update(
+        due, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"]
+    )
+    return result
+
+
+def outbox_depth():
+    """Messages still waiting to be sent, due now or backing off."""
+    return EmailOutbox.objects.filter(status=EmailOutbox.PENDING).count()
+
+
+MEMBER_IMPORT_HEADER = ["email", "first_name", "last_name", "scheme"]
+
+
+def _resolve_scheme(value, schemes_by_name):
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return get_scheme(int(value))
+    return schemes_by_name.get(value.lower())
+
+
+def onboard_members(lines, password=None, batch_size=1000, rejects=None):
+    """
+    Create members in bulk from CSV text lines with the columns email,
+    first_name, last_name and scheme (name or id); a header row is skipped.
+
+    Users and profiles are inserted with bulk_create, so the per-row
+    post_save signals never run. The password is hashed once for the whole
+    import, or left unusable when none is given so members set their own
+    through the password setup mail. Member ids come from the allocator.
+
+    Rows with a bad email, an unknown scheme or an email that is already
+    registered go to the csv writer `rejects` with the reason appended.
+    """
+    password_hash = make_password(password)
+    schemes_by_name = {scheme.name.lower(): scheme for scheme in scheme_catalog().values()}
+    totals = {"created": 0, "rejected": 0}
+
+    def reject(row, reason):
+        totals["rejected"] += 1
+        if rejects is not None:
+            rejects.writerow(list(row) + [reason])
+
+    def flush(batch):
+        emails = [email for email, row, scheme in batch]
+        taken = set(User.objects.filter(username__in=emails).values_list("username", flat=True))
+
+        new = []
+        for email, row, scheme in batch:
+            if email in taken:
+                reject(row, "email already registered")
+            else:
+                new.append((email, row, scheme))
+        if not new:
+            return
+
+        # Allocated before the transaction so whole blocks are reserved
+        member_ids = allocate_member_ids(len(new))
+        with transaction.atomic():
+            users = User.objects.bulk_create([
+                User(
+                    username=email,
+                    email=email,
+                    first_name=row[1].strip() if len(row) > 1 else "",
+                    last_name=row[2].strip() if len(row) > 2 else "",
+                    password=password_hash,
+                )
+                for email, row, scheme in new
+            ])
+            UserProfile.objects.bulk_create([
+                UserProfile(user=user, scheme=scheme, member_id=member_id)
+                for user, (email, row, scheme), member_id in zip(users, new, member_ids)
+            ])
+        totals["created"] += len(users)
+
+    batch = []
+    seen = set()
+    for number, row in enumerate(csv.reader(lines)):
+        if not row or not any(cell.strip() for cell in row):
+            continue
+        if number == 0 and row[0].strip().lower() == MEMBER_IMPORT_HEADER[0]:
+            continue
+
+        email = row[0].strip().lower()
+        if "@" not in email:
+            reject(row, "invalid email")
+            continue
+        if email in seen:
+            reject(row, "duplicate email in file")
+            continue
+
+        scheme = _resolve_scheme(row[3] if len(row) > 3 else "", schemes_by_name)
+        if scheme is None and len(row) > 3 and row[3].strip():
+            reject(row, "unknown scheme")
+            continue
+
+        seen.add(email)
+        batch.append((email, row, scheme))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+
+    if batch:
+        flush(batch)
+
+    return totals
+
+
+# --------------------------
+# Ledger delta export
+# --------------------------
+# Every charge and reward write sets updated_at, so the rows changed since
+# a watermark are a range scan on (updated_at, id). The next watermark is
+# fixed before reading: now minus settings.DELTA_EXPORT_LAG_SECONDS, which
+# leaves room for transactions still in flight when the export ran (their
+# rows carry an earlier timestamp than their commit). That only holds for
+# transactions shorter than the lag: bulk ledger writes go through
+# ledger_transaction, which refuses to commit one that ran over half of
+# it, and monthly billing always runs in shards. Deleted rows are not
+# reported.
+
+DELTA_EXPORT_HEADER = [
+    "table", "id", "member_id", "user_id", "month", "paid", "reward_text", "updated_at",
+]
+
+
+def delta_watermark():
+    return timezone.now() - timedelta(seconds=settings.DELTA_EXPORT_LAG_SECONDS)
+
+
+def parse_watermark(value):
+    """The datetime in a watermark string, or None for an empty one."""
+    if not value:
+        return None
+    watermark = datetime.fromisoformat(value)
+    if timezone.is_naive(watermark):
+        raise ValueError("watermark needs a UTC offset")
+    return watermark
+
+
+def ledger_changes(since, until):
+    """
+    Charges, then rewards, with updated_at in (since, until] as dicts keyed
+    by DELTA_EXPORT_HEADER, oldest change first. `since` None means all.
+    """
+    sources = [
+        ("charge", MonthlyCharge, "charge_month"),
+        ("reward", MonthlyReward, "reward_month"),
+    ]
+    for table, model, month_field in sources:
+        rows = model.objects.filter(updated_at__lte=until)
+        if since is not None:
+            rows = rows.filter(updated_at__gt=since)
+        extra = "paid" if model is MonthlyCharge else "reward_text"
+
+        for pk, member_id, user_id, month, value, updated_at in (
+            rows.order_by("updated_at", "id")
+            .values_list("id", "user__userprofile__member_id", "user_id", month_field, extra, "updated_at")
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        ):
+            yield {
+                "table": table,
+                "id": pk,
+                "member_id": member_id,
+                "user_id": user_id,
+                "month": month.isoformat(),
+                "paid": value if extra == "paid" else None,
+                "reward_text": value if extra == "reward_text" else None,
+                "updated_at": updated_at.isoformat(),
+            }
+
 
-        # Create locked reward
-        MonthlyReward.objects.create(
-            user=user,
-            scheme=scheme,
-            month=month_str,
-            reward_text=scheme.monthly_reward_text,
-            is_unlocked=False
+def ledger_change_lines(changes, fmt):
+    """Text lines of `changes` as "ndjson" or "csv"."""
+    if fmt == "csv":
+        return csv_lines(
+            DELTA_EXPORT_HEADER,
+            ([change[column] for column in DELTA_EXPORT_HEADER] for change in changes),
         )
+    return (json.dumps(change) + "\n" for change in changes)
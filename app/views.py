@@ -1,24 +1,70 @@
+from django.conf import settings
+from django.core.paginator import Paginator
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.mail import send_mail
+from django.http import FileResponse, Http404, JsonResponse
+from django.views.decorators.http import condition, require_POST
+from django.db import transaction
+from django.urls import reverse
 from django.utils import timezone
 
-from datetime import timedelta
+from datetime import datetime, timedelta
 import csv
-from django.http import HttpResponse
+import io
+import os
+import tempfile
+import time
+import uuid
+from itertools import islice
 
 from app.models import (
     Scheme,
     UserProfile,
     MonthlyCharge,
     MonthlyReward,
+    EmailOutbox,
     EmailToken,
-    generate_member_id
+    MemberLedgerSummary,
+    MonthlyJob,
 )
 
-from app.utils import generate_monthly_entries
+from app.cache import (
+    get_scheme,
+    member_page_context,
+    member_page_stats,
+    scheme_catalog,
+    scheme_catalog_etag,
+)
+from app.arrears import ARREARS_CSV_HEADER, Arrears
+from app.routers import use_replica
+from app.utils import (
+    EXPORT_CHUNK_SIZE,
+    bulk_mark_paid,
+    current_month,
+    delta_watermark,
+    enqueue_monthly_job,
+    keyset_page,
+    last_reward_months,
+    ledger_change_lines,
+    ledger_changes,
+    ledger_filters,
+    mark_paid,
+    member_summaries,
+    monthly_job_status,
+    onboard_members,
+    member_summary_row,
+    page_links,
+    parse_watermark,
+    reconcile_statement,
+    rollup_month_totals,
+    scheme_rollup_report,
+    RejectPreview,
+    stream_csv,
+    stream_lines,
+    wants_gzip,
+)
 
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
@@ -33,25 +79,39 @@ def quick_mark_paid(request, user_id):
 
     today_month = date.today().replace(day=1)
 
-    user = User.objects.get(id=user_id)
-    profile = user.userprofile
+    user = get_object_or_404(User, id=user_id)
+    mark_paid([(user.id, today_month)])
 
-    charge, created = MonthlyCharge.objects.get_or_create(
-        user=user,
-        charge_month=today_month,
-        defaults={"paid": True}
-    )
+    return redirect("/admin/auth/user/")
 
-    charge.paid = True
-    charge.save()
 
-    MonthlyReward.objects.update_or_create(
-        user=user,
-        reward_month=today_month,
-        defaults={"reward_text": profile.scheme.monthly_reward_text}
+@login_required
+@require_POST
+def bulk_mark_paid_view(request):
+    """
+    Mark many payments at once. POST `member_ids` (member ids for `month`,
+    YYYY-MM, default this month) and/or `charge_ids`, separated by commas,
+    spaces or new lines. Responds with the created/updated/skipped counts.
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    month = None
+    if request.POST.get("month"):
+        try:
+            month = datetime.strptime(request.POST["month"], "%Y-%m").date()
+        except ValueError:
+            return JsonResponse({"error": "month must look like YYYY-MM"}, status=400)
+
+    member_ids = request.POST.get("member_ids", "").replace(",", " ").split()
+    charge_ids = request.POST.get("charge_ids", "").replace(",", " ").split()
+    if not all(c.isdigit() for c in charge_ids):
+        return JsonResponse({"error": "charge_ids must be numbers"}, status=400)
+
+    result = bulk_mark_paid(
+        month, member_ids=member_ids, charge_ids=[int(c) for c in charge_ids]
     )
-
-    return redirect("/admin/auth/user/")
+    return JsonResponse(result)
 
 # ---------------------------------------------------
 # PUBLIC PAGES
@@ -60,8 +120,9 @@ def dashboard(request):
     return render(request, "dashboard.html")
 
 
+@condition(etag_func=lambda request: scheme_catalog_etag())
 def scheme_list(request):
-    return render(request, "schemes.html", {"schemes": Scheme.objects.all()})
+    return render(request, "schemes.html", {"schemes": scheme_catalog().values()})
 
 
 # ---------------------------------------------------
@@ -70,14 +131,15 @@ def scheme_list(request):
 def send_password_setup(request, user_id):
     user = get_object_or_404(User, id=user_id)
 
-    token = EmailToken.objects.create(
-        user=user,
-        expiry=timezone.now() + timedelta(hours=24)
-    )
+    with transaction.atomic():
+        token = EmailToken.objects.create(
+            user=user,
+            expiry=timezone.now() + timedelta(hours=24)
+        )
 
-    link = request.build_absolute_uri(f"/set-password/{token.token}/")
+        link = request.build_absolute_uri(f"/set-password/{token.token}/")
 
-    message = f"""
+        message = f"""
 Hello {user.email},
 
 Welcome! Please click the link below to set your password:
@@ -89,15 +151,14 @@ This link is valid for 24 hours.
 Thank you.
 """
 
-    send_mail(
-        subject="Set your password",
-        message=message,
-        from_email=None,
-        recipient_list=[user.email],
-        fail_silently=False
-    )
+        # Delivered by the sendoutbox worker, not inside this request
+        EmailOutbox.objects.create(
+            to_email=user.email,
+            subject="Set your password",
+            body=message,
+        )
 
-    messages.success(request, "Password setup email sent successfully!")
+    messages.success(request, "Password setup email queued for sending!")
     return redirect('/admin/auth/user/')
 
 
@@ -150,36 +211,95 @@ def admin_dashboard(request):
 
     profiles = UserProfile.objects.select_related("user", "scheme").all()
 
+    this_month = current_month()
+    last_month = (this_month - timedelta(days=1)).replace(day=1)
+    totals = rollup_month_totals([this_month, last_month])
+    job = MonthlyJob.objects.order_by("-created_at", "-id").first()
+
     return render(request, "admin_dashboard.html", {
-        "profiles": profiles
+        "profiles": profiles,
+        "job": monthly_job_status(job) if job else None,
+        "cache_stats": member_page_stats(),
+        "this_month": this_month,
+        "kpis": totals[this_month],
+        "last_kpis": totals[last_month],
     })
 
 
 # ---------------------------------------------------
-# ADMIN MEMBERS LIST
+# SCHEME MONTHLY ROLLUP REPORT
 # ---------------------------------------------------
+def _rollup_range(request):
+    """(months, first month, last month, scheme id) from ?months=&scheme= ."""
+    try:
+        months = max(1, min(int(request.GET.get("months", 12)), 600))
+    except ValueError:
+        months = 12
+    scheme_id = request.GET.get("scheme", "")
+    scheme_id = int(scheme_id) if scheme_id.isdigit() else None
+
+    last = current_month()
+    year, month = divmod(last.year * 12 + last.month - 1 - (months - 1), 12)
+    return months, last.replace(year=year, month=month + 1), last, scheme_id
+
+
 @login_required
-def admin_members(request):
+@use_replica
+def admin_rollups(request):
     if not request.user.is_superuser:
         return redirect("/")
 
-    profiles = UserProfile.objects.select_related("user", "scheme")
+    months, first, last, scheme_id = _rollup_range(request)
 
-    members = []
-    for profile in profiles:
-        last_reward = MonthlyReward.objects.filter(
-            user=profile.user,
-            is_unlocked=True
-        ).order_by('-month').first()
+    return render(request, "admin_rollups.html", {
+        "title": "Scheme Collections",
+        "report": scheme_rollup_report(first, last, scheme_id),
+        "schemes": scheme_catalog().values(),
+        "scheme_id": scheme_id,
+        "months": months,
+    })
 
-        last_reward_month = last_reward.month if last_reward else "None"
 
+@login_required
+@use_replica
+def rollups_json(request):
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    months, first, last, scheme_id = _rollup_range(request)
+    report = scheme_rollup_report(first, last, scheme_id)
+
+    return JsonResponse({
+        "months": [
+            {
+                "month": f"{month:%Y-%m}",
+                "total": cells["total"],
+                "schemes": [
+                    {**cell, "month": f"{month:%Y-%m}"} for cell in cells["schemes"]
+                ],
+            }
+            for month, cells in report.items()
+        ],
+    })
+
+
+# ---------------------------------------------------
+# ADMIN MEMBERS LIST
+# ---------------------------------------------------
+@login_required
+@use_replica
+def admin_members(request):
+    if not request.user.is_superuser:
+        return redirect("/")
+
+    members = []
+    for profile in last_reward_months():
         members.append({
             "name": f"{profile.user.first_name} {profile.user.last_name}",
             "member_id": profile.member_id,
-            "scheme": profile.scheme.name if profile.scheme else "",
+            "scheme": str(profile.get_scheme() or ""),
             "email": profile.user.email,
-            "last_reward": last_reward_month,
+            "last_reward": profile.last_reward_month or "None",
         })
 
     return render(request, "admin_members.html", {
@@ -187,163 +307,189 @@ def admin_members(request):
         "members": members
     })
 @login_required
+@use_replica
 def admin_members_summary(request):
     if not request.user.is_superuser:
         return redirect("/")
 
-    profiles = UserProfile.objects.select_related("user", "scheme")
-
-    members = []
-    for profile in profiles:
-        user = profile.user
-
-        charges_paid = MonthlyCharge.objects.filter(
-            user=user,
-            status="Paid"
-        ).count()
+    try:
+        per_page = int(request.GET.get("per_page", settings.MEMBERS_SUMMARY_PAGE_SIZE))
+    except ValueError:
+        per_page = settings.MEMBERS_SUMMARY_PAGE_SIZE
+    per_page = max(1, min(per_page, 500))
 
-        rewards_received = MonthlyReward.objects.filter(
-            user=user,
-            is_unlocked=True
-        ).count()
-
-        join_date = user.date_joined.strftime("%Y-%m-%d")
-
-        members.append({
-            "name": f"{user.first_name} {user.last_name}",
-            "member_id": profile.member_id,
-            "scheme": profile.scheme.name,
-            "join_date": join_date,
-            "charges_paid": charges_paid,
-            "rewards_received": rewards_received,
-        })
+    paginator = Paginator(member_summaries().order_by("id"), per_page)
+    page = paginator.get_page(request.GET.get("page"))
 
     return render(request, "admin_members_summary.html", {
-        "members": members,
+        "members": [member_summary_row(profile) for profile in page],
+        "page": page,
+        "per_page": per_page,
+        "schemes": [scheme.name for scheme in scheme_catalog().values()],
         "title": "Member Accumulation Summary"
     })
 @login_required
+@use_replica
 def admin_member_summary_single(request, member_id):
     if not request.user.is_superuser:
         return redirect("/")
 
-    profile = get_object_or_404(UserProfile, member_id=member_id)
-    user = profile.user
+    profile = get_object_or_404(member_summaries(), member_id=member_id)
 
-    charges_paid = MonthlyCharge.objects.filter(
-        user=user,
-        status="Paid"
-    ).count()
+    context = member_summary_row(profile)
+    context["title"] = "Member Summary"
 
-    rewards_received = MonthlyReward.objects.filter(
-        user=user,
-        is_unlocked=True
-    ).count()
-
-    join_date = user.date_joined.strftime("%Y-%m-%d")
+    return render(request, "admin_member_summary_single.html", context)
+SUMMARY_CSV_HEADER = ["Name", "Member ID", "Scheme", "Join Date", "Charges Paid", "Rewards Received"]
 
-    context = {
-        "title": "Member Summary",
-        "name": f"{user.first_name} {user.last_name}",
-        "member_id": member_id,
-        "scheme": profile.scheme.name,
-        "join_date": join_date,
-        "charges_paid": charges_paid,
-        "rewards_received": rewards_received
-    }
 
-    return render(request, "admin_member_summary_single.html", context)
 @login_required
+@use_replica
 def export_members_summary_csv(request):
     if not request.user.is_superuser:
         return redirect("/")
 
-    profiles = UserProfile.objects.select_related("user", "scheme")
+    profiles = member_summaries().order_by("id").iterator(chunk_size=EXPORT_CHUNK_SIZE)
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="members_summary.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow(["Name", "Member ID", "Scheme", "Join Date", "Charges Paid", "Rewards Received"])
+    return stream_csv(
+        "members_summary.csv",
+        SUMMARY_CSV_HEADER,
+        (member_summary_row(profile).values() for profile in profiles),
+        compress=wants_gzip(request),
+    )
+@login_required
+@use_replica
+def export_member_single_csv(request, member_id):
+    if not request.user.is_superuser:
+        return redirect("/")
 
-    for profile in profiles:
-        user = profile.user
+    profile = get_object_or_404(member_summaries(), member_id=member_id)
 
-        charges_paid = MonthlyCharge.objects.filter(user=user, status="Paid").count()
-        rewards_received = MonthlyReward.objects.filter(user=user, is_unlocked=True).count()
+    return stream_csv(
+        f"{member_id}_summary.csv",
+        SUMMARY_CSV_HEADER,
+        [member_summary_row(profile).values()],
+        compress=wants_gzip(request),
+    )
 
-        writer.writerow([
-            f"{user.first_name} {user.last_name}",
-            profile.member_id,
-            profile.scheme.name,
-            user.date_joined.strftime("%Y-%m-%d"),
-            charges_paid,
-            rewards_received,
-        ])
 
-    return response
+# ---------------------------------------------------
+# EXPORT MEMBERS CSV
+# ---------------------------------------------------
 @login_required
-def export_member_single_csv(request, member_id):
+@use_replica
+def export_members_csv(request):
     if not request.user.is_superuser:
         return redirect("/")
 
-    profile = get_object_or_404(UserProfile, member_id=member_id)
-    user = profile.user
+    profiles = last_reward_months().order_by("id").iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    rows = (
+        [
+            f"{profile.user.first_name} {profile.user.last_name}",
+            profile.member_id,
+            str(profile.get_scheme() or ""),
+            profile.user.email,
+            profile.last_reward_month or "None",
+        ]
+        for profile in profiles
+    )
 
-    charges_paid = MonthlyCharge.objects.filter(user=user, status="Paid").count()
-    rewards_received = MonthlyReward.objects.filter(user=user, is_unlocked=True).count()
+    return stream_csv(
+        "members.csv",
+        ["Name", "Member ID", "Scheme", "Email", "Last Reward"],
+        rows,
+        compress=wants_gzip(request),
+    )
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{member_id}_summary.csv"'
 
-    writer = csv.writer(response)
-    writer.writerow(["Name", "Member ID", "Scheme", "Join Date", "Charges Paid", "Rewards Received"])
+# ---------------------------------------------------
+# LEDGER DELTA EXPORT
+# ---------------------------------------------------
+@login_required
+def export_ledger_changes(request):
+    """
+    Charges and rewards changed since ?since=<watermark> (everything when
+    absent), as NDJSON or ?format=csv, optionally ?gzip=1. The watermark to
+    send next time is in the X-Next-Watermark header. Reads the primary:
+    a lagging replica could hide rows older than the watermark.
+    """
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "forbidden"}, status=403)
 
-    writer.writerow([
-        f"{user.first_name} {user.last_name}",
-        member_id,
-        profile.scheme.name,
-        user.date_joined.strftime("%Y-%m-%d"),
-        charges_paid,
-        rewards_received,
-    ])
+    try:
+        since = parse_watermark(request.GET.get("since", ""))
+    except ValueError:
+        return JsonResponse({"error": "since must be a watermark returned by this endpoint"}, status=400)
 
+    fmt = "csv" if request.GET.get("format") == "csv" else "ndjson"
+    until = delta_watermark()
+
+    response = stream_lines(
+        f"ledger_changes.{fmt}",
+        ledger_change_lines(ledger_changes(since, until), fmt),
+        "text/csv" if fmt == "csv" else "application/x-ndjson",
+        compress=wants_gzip(request),
+    )
+    response["X-Next-Watermark"] = until.isoformat()
     return response
 
 
 # ---------------------------------------------------
-# EXPORT MEMBERS CSV
+# ARREARS REPORT
 # ---------------------------------------------------
-@login_required
-def export_members_csv(request):
-    if not request.user.is_superuser:
-        return redirect("/")
+ARREARS_PAGE_ROWS = 200
 
-    profiles = UserProfile.objects.select_related("user", "scheme")
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="members.csv"'
+def _arrears_months(request):
+    try:
+        months = int(request.GET.get("months", 60))
+    except ValueError:
+        months = 60
+    return max(1, min(months, 240))
 
-    writer = csv.writer(response)
-    writer.writerow(["Name", "Member ID", "Scheme", "Email", "Last Reward"])
 
-    for profile in profiles:
-        last_reward = MonthlyReward.objects.filter(
-            user=profile.user,
-            is_unlocked=True
-        ).order_by('-month').first()
+@login_required
+@use_replica
+def admin_arrears(request):
+    if not request.user.is_superuser:
+        return redirect("/")
 
-        last_reward_month = last_reward.month if last_reward else "None"
+    months = _arrears_months(request)
+    arrears = Arrears(months)
+    schemes = arrears.scheme_totals()
+
+    return render(request, "admin_arrears.html", {
+        "title": "Arrears",
+        "months": months,
+        "schemes": schemes,
+        "totals": {
+            key: sum(scheme[key] for scheme in schemes.values())
+            for key in ("members", "pending", "owed")
+        },
+        "rows": list(islice(arrears.rows(), ARREARS_PAGE_ROWS)),
+        "row_limit": ARREARS_PAGE_ROWS,
+    })
 
-        writer.writerow([
-            f"{profile.user.first_name} {profile.user.last_name}",
-            profile.member_id,
-            profile.scheme.name if profile.scheme else "",
-            profile.user.email,
-            last_reward_month
-        ])
 
-    return response
+@login_required
+@use_replica
+def export_arrears_csv(request):
+    if not request.user.is_superuser:
+        return redirect("/")
+
+    arrears = Arrears(_arrears_months(request))
+
+    return stream_csv(
+        "arrears.csv",
+        ARREARS_CSV_HEADER,
+        (
+            [row["member_id"], row["name"], row["scheme"],
+             row["pending"], row["longest_streak"], row["owed"]]
+            for row in arrears.rows()
+        ),
+        compress=wants_gzip(request),
+    )
 
 
 # ---------------------------------------------------
@@ -351,21 +497,26 @@ def export_members_csv(request):
 # ---------------------------------------------------
 @login_required
 def user_dashboard(request):
-    profile = UserProfile.objects.get(user=request.user)
-
-    unlocked = MonthlyReward.objects.filter(
-        user=request.user,
-        is_unlocked=True
-    ).count()
-
-    context = {
-        "title": "User Dashboard",
-        "member_id": profile.member_id,
-        "scheme_name": profile.scheme.name if profile.scheme else "No Scheme Assigned",
-        "amount": (profile.scheme.amount if profile.scheme else 0),
-        "unlocked_rewards": unlocked,
-    }
+    def build():
+        profile = UserProfile.objects.select_related(
+            "user__ledger_summary"
+        ).get(user=request.user)
+        scheme = profile.get_scheme()
+
+        try:
+            unlocked = profile.user.ledger_summary.rewards_received
+        except MemberLedgerSummary.DoesNotExist:
+            unlocked = 0
+
+        return {
+            "title": "User Dashboard",
+            "member_id": profile.member_id,
+            "scheme_name": scheme.name if scheme else "No Scheme Assigned",
+            "amount": (scheme.amount if scheme else 0),
+            "unlocked_rewards": unlocked,
+        }
 
+    context = member_page_context(request, "user_dashboard", build)
     return render(request, "user_dashboard.html", context)
 
 
@@ -374,45 +525,73 @@ def user_dashboard(request):
 # ---------------------------------------------------
 @login_required
 def user_scheme(request):
-    profile = UserProfile.objects.get(user=request.user)
+    def build():
+        profile = UserProfile.objects.get(user=request.user)
+        return {
+            "title": "My Scheme",
+            "scheme": profile.get_scheme(),
+            "member_id": profile.member_id
+        }
 
-    return render(request, "user_scheme.html", {
-        "title": "My Scheme",
-        "scheme": profile.scheme,
-        "member_id": profile.member_id
-    })
+    context = member_page_context(request, "user_scheme", build)
+    return render(request, "user_scheme.html", context)
 
 
 @login_required
 def user_charges(request):
-    charges = MonthlyCharge.objects.filter(user=request.user).order_by('-month')
+    def build():
+        scheme = UserProfile.objects.get(user=request.user).get_scheme()
 
-    return render(request, "user_charges.html", {
-        "title": "Monthly Charges",
-        "charges": charges
-    })
+        charges, next_cursor, prev_cursor = keyset_page(
+            MonthlyCharge.objects.filter(user=request.user),
+            "charge_month",
+            request.GET.get("cursor"),
+        )
+
+        return {
+            "title": "Monthly Charges",
+            "charges": charges,
+            "charge_amount": scheme.monthly_charge if scheme else 0,
+            **page_links({}, next_cursor, prev_cursor),
+        }
+
+    context = member_page_context(request, "user_charges", build)
+    return render(request, "user_charges.html", context)
 
 
 @login_required
 def user_rewards(request):
-    rewards = MonthlyReward.objects.filter(user=request.user).order_by('-month')
+    def build():
+        rewards, next_cursor, prev_cursor = keyset_page(
+            MonthlyReward.objects.filter(user=request.user),
+            "reward_month",
+            request.GET.get("cursor"),
+        )
 
-    return render(request, "user_rewards.html", {
-        "title": "Monthly Rewards",
-        "rewards": rewards
-    })
+        return {
+            "title": "Monthly Rewards",
+            "rewards": rewards,
+            **page_links({}, next_cursor, prev_cursor),
+        }
+
+    context = member_page_context(request, "user_rewards", build)
+    return render(request, "user_rewards.html", context)
 
 
 @login_required
 def user_profile(request):
-    profile = UserProfile.objects.get(user=request.user)
+    # `user` comes from the auth context processor, not the cache, so
+    # name and email edits show up straight away
+    def build():
+        profile = UserProfile.objects.get(user=request.user)
+        return {
+            "title": "My Profile",
+            "profile": profile,
+            "scheme": profile.get_scheme(),
+        }
 
-    return render(request, "user_profile.html", {
-        "title": "My Profile",
-        "profile": profile,
-        "user": request.user,
-        "scheme": profile.scheme,
-    })
+    context = member_page_context(request, "user_profile", build)
+    return render(request, "user_profile.html", context)
 
 
 # ---------------------------------------------------
@@ -423,24 +602,82 @@ def run_monthly_now(request):
     if not request.user.is_superuser:
         return redirect("/")
 
-    generate_monthly_entries()
-    messages.success(request, "Monthly processing completed!")
+    # Billing runs in the runjobs worker; the dashboard polls its progress
+    job, created = enqueue_monthly_job(user=request.user)
+    if created:
+        messages.success(request, f"Monthly processing for {job.month:%b %Y} queued (job #{job.id}).")
+    else:
+        messages.warning(
+            request,
+            f"Monthly processing for {job.month:%b %Y} is already {job.status} (job #{job.id}).",
+        )
     return redirect("/admin-dashboard/")
 
 
+@login_required
+def monthly_job_status_json(request):
+    """Progress of ?job=<id>, or of the latest job, for the dashboard to poll."""
+    if not request.user.is_superuser:
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    jobs = MonthlyJob.objects.order_by("-created_at", "-id")
+    job_id = request.GET.get("job", "")
+    if job_id.isdigit():
+        jobs = jobs.filter(pk=job_id)
+    job = jobs.first()
+
+    return JsonResponse({"job": monthly_job_status(job) if job else None})
+
+
 # ---------------------------------------------------
 # ADMIN CHARGES & REWARDS
 # ---------------------------------------------------
 @login_required
+@use_replica
 def admin_charges(request):
-    charges = MonthlyCharge.objects.all().order_by('-month')
-    return render(request, "admin_charges.html", {"charges": charges})
+    if not request.user.is_superuser:
+        return redirect("/")
+
+    charges, filters = ledger_filters(
+        request,
+        MonthlyCharge.objects.select_related("user__userprofile__scheme"),
+        "charge_month",
+    )
+    charges, next_cursor, prev_cursor = keyset_page(
+        charges, "charge_month", request.GET.get("cursor")
+    )
+
+    return render(request, "admin_charges.html", {
+        "title": "Monthly Charges",
+        "charges": charges,
+        "filters": filters,
+        "schemes": scheme_catalog().values(),
+        **page_links(filters, next_cursor, prev_cursor),
+    })
 
 
 @login_required
+@use_replica
 def admin_rewards(request):
-    rewards = MonthlyReward.objects.all().order_by('-month')
-    return render(request, "admin_rewards.html", {"rewards": rewards})
+    if not request.user.is_superuser:
+        return redirect("/")
+
+    rewards, filters = ledger_filters(
+        request,
+        MonthlyReward.objects.select_related("user__userprofile__scheme"),
+        "reward_month",
+    )
+    rewards, next_cursor, prev_cursor = keyset_page(
+        rewards, "reward_month", request.GET.get("cursor")
+    )
+
+    return render(request, "admin_rewards.html", {
+        "title": "Monthly Rewards",
+        "rewards": rewards,
+        "filters": filters,
+        "schemes": scheme_catalog().values(),
+        **page_links(filters, next_cursor, prev_cursor),
+    })
 
 
 # ---------------------------------------------------
@@ -448,22 +685,100 @@ def admin_rewards(request):
 # ---------------------------------------------------
 @login_required
 def mark_charge_paid(request, charge_id):
+    if not request.user.is_superuser:
+        return redirect("/")
+
     charge = get_object_or_404(MonthlyCharge, id=charge_id)
+    mark_paid([(charge.user_id, charge.charge_month)])
+
+    return redirect('/admin-charges/')
+
+
+# ---------------------------------------------------
+# ADMIN: BANK STATEMENT RECONCILIATION
+# ---------------------------------------------------
+# Every rejected line of an upload is kept in a server-side file the
+# uploader can download; files older than a day are pruned on each upload.
+RECONCILE_REJECTS_DIR = os.path.join(tempfile.gettempdir(), "reconcile-rejects")
+RECONCILE_REJECTS_MAX_AGE = 24 * 3600
+
+
+def _reconcile_rejects_path(token):
+    return os.path.join(RECONCILE_REJECTS_DIR, f"{token}.csv")
+
+
+def _prune_reconcile_rejects():
+    cutoff = time.time() - RECONCILE_REJECTS_MAX_AGE
+    for entry in os.scandir(RECONCILE_REJECTS_DIR):
+        if entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+@login_required
+def admin_reconcile(request):
+    if not request.user.is_superuser:
+        return redirect("/")
+
+    context = {"title": "Reconcile Bank Statement"}
+
+    if request.method == "POST" and request.FILES.get("statement"):
+        statement = io.TextIOWrapper(request.FILES["statement"].file, encoding="utf-8-sig")
+
+        os.makedirs(RECONCILE_REJECTS_DIR, exist_ok=True)
+        _prune_reconcile_rejects()
+        token = uuid.uuid4().hex
+        path = _reconcile_rejects_path(token)
+        with open(path, "w", newline="", encoding="utf-8") as rejects_file:
+            rejects = RejectPreview(spill=csv.writer(rejects_file))
+            context["totals"] = reconcile_statement(statement, rejects)
+
+        if context["totals"]["rejected"]:
+            request.session["reconcile_rejects"] = token
+            context["rejects_url"] = reverse("reconcile_rejects", args=[token])
+        else:
+            os.remove(path)
+        context["rejects"] = rejects.rows
+        messages.success(request, "Statement reconciled.")
+
+    return render(request, "admin_reconcile.html", context)
 
-    charge.status = "Paid"
-    charge.paid_at = timezone.now()
-    charge.save()
 
-    reward = MonthlyReward.objects.get(
-        user=charge.user,
-        scheme=charge.scheme,
-        month=charge.month
+@login_required
+def reconcile_rejects(request, token):
+    """Download every rejected line of the caller's last reconciliation."""
+    if not request.user.is_superuser:
+        return redirect("/")
+    if token != request.session.get("reconcile_rejects"):
+        raise Http404
+
+    try:
+        rejects_file = open(_reconcile_rejects_path(token), "rb")
+    except FileNotFoundError:
+        raise Http404
+    return FileResponse(
+        rejects_file, as_attachment=True, filename="statement_rejects.csv", content_type="text/csv"
     )
-    reward.is_unlocked = True
-    reward.unlocked_at = timezone.now()
-    reward.save()
 
-    return redirect('/admin-charges/')
+
+# ---------------------------------------------------
+# ADMIN: BULK MEMBER IMPORT
+# ---------------------------------------------------
+@login_required
+def admin_import_members(request):
+    if not request.user.is_superuser:
+        return redirect("/")
+
+    context = {"title": "Import Members"}
+
+    if request.method == "POST" and request.FILES.get("members"):
+        members = io.TextIOWrapper(request.FILES["members"].file, encoding="utf-8-sig")
+        rejects = RejectPreview()
+
+        context["totals"] = onboard_members(members, rejects=rejects)
+        context["rejects"] = rejects.rows
+        messages.success(request, "Members imported.")
+
+    return render(request, "admin_import_members.html", context)
 
 
 # ---------------------------------------------------
@@ -479,16 +794,15 @@ def admin_add_user(request):
         last = request.POST.get("last_name")
         email = request.POST.get("email")
 
-        user = User.objects.create_user(
+        # The profile comes from the post_save signal; without a password
+        # the member sets one through the setup mail
+        User.objects.create_user(
             username=email,
             email=email,
             first_name=first,
             last_name=last,
-            password=User.objects.make_random_password()
         )
 
-        UserProfile.objects.create(user=user)
-
         messages.success(request, "User created successfully.")
         return redirect("/admin-dashboard/")
 
@@ -511,12 +825,15 @@ def admin_edit_profile(request, user_id):
     if not request.user.is_superuser:
         return redirect("/")
 
-    profile = UserProfile.objects.get(user_id=user_id)
-    schemes = Scheme.objects.all()
+    profile = get_object_or_404(UserProfile, user_id=user_id)
+    schemes = scheme_catalog().values()
 
     if request.method == "POST":
-        scheme_id = request.POST.get("scheme")
-        profile.scheme = Scheme.objects.get(id=scheme_id)
+        scheme_id = request.POST.get("scheme", "")
+        scheme = get_scheme(int(scheme_id)) if scheme_id.isdigit() else None
+        if scheme is None:
+            raise Http404("Unknown scheme")
+        profile.scheme = scheme
         profile.save()
         messages.success(request, "Profile updated")
         return redirect("/admin-dashboard/")
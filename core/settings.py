@@ -15,12 +15,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE=[
+ 'app.middleware.QueryBudgetMiddleware',
  'django.middleware.security.SecurityMiddleware',
  'django.contrib.sessions.middleware.SessionMiddleware',
  'django.middleware.common.CommonMiddleware',
  'django.middleware.csrf.CsrfViewMiddleware',
  'django.contrib.auth.middleware.AuthenticationMiddleware',
  'django.contrib.messages.middleware.MessageMiddleware',
+ 'app.middleware.PrimaryPinMiddleware',
 ]
 ROOT_URLCONF='core.urls'
 TEMPLATES=[{
@@ -35,7 +37,40 @@ TEMPLATES=[{
  ]},
 }]
 WSGI_APPLICATION='core.wsgi.application'
-DATABASES={'default':{'ENGINE':'django.db.backends.sqlite3','NAME':BASE_DIR/'db.sqlite3'}}
+DATABASES={'default':{
+ 'ENGINE':'django.db.backends.sqlite3',
+ 'NAME':BASE_DIR/'db.sqlite3',
+ # Take the write lock at BEGIN so concurrent runmonthly workers queue up
+ # behind each other instead of failing with "database is locked".
+ 'OPTIONS':{'transaction_mode':'IMMEDIATE','timeout':30},
+},
+ # Reports and exports read from here (see app.routers). Locally it is the
+ # same file opened read-only; point it at a real replica in production.
+ 'reporting':{
+ 'ENGINE':'django.db.backends.sqlite3',
+ 'NAME':f"{(BASE_DIR/'db.sqlite3').as_uri()}?mode=ro",
+ 'OPTIONS':{'timeout':30},
+ 'TEST':{'MIRROR':'default'},
+}}
+DATABASE_ROUTERS=['app.routers.ReportingRouter']
+REPLICA_PIN_SECONDS=10
+# app.middleware.QueryBudgetMiddleware
+QUERY_BUDGET_MAX_QUERIES=30
+QUERY_BUDGET_REPEAT_THRESHOLD=5   # same statement shape more often = N+1
+QUERY_BUDGET_HEADERS=DEBUG
+# Delta export watermarks trail the clock by this much (see app.utils)
+DELTA_EXPORT_LAG_SECONDS=60
+# A running monthly job with no heartbeat for this long can be taken over
+MONTHLY_JOB_STALE_SECONDS=300
+# scheduler command: bill each month on this day at this TIME_ZONE time,
+# catching up at most this many missed months
+MONTHLY_RUN_DAY=1
+MONTHLY_RUN_TIME='00:30'
+MONTHLY_RUN_CATCHUP_MONTHS=3
+# a failing month is retried after 5, 10, 20... minutes, then given up
+MONTHLY_RUN_RETRY_SECONDS=300
+MONTHLY_RUN_MAX_ATTEMPTS=5
+SCHEDULER_LEASE_SECONDS=120
 AUTH_PASSWORD_VALIDATORS=[]
 LANGUAGE_CODE='en-us'
 TIME_ZONE='Asia/Kolkata'
@@ -53,7 +88,21 @@ EMAIL_HOST_USER = 'YOUR_GMAIL_ADDRESS@gmail.com'
 EMAIL_HOST_PASSWORD = 'YOUR_16_CHAR_APP_PASSWORD'
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 LOGIN_REDIRECT_URL = '/login-redirect/'
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # For several processes use a shared backend, e.g.
+        # 'django.core.cache.backends.filebased.FileBasedCache' with a LOCATION.
+        # The member page hit/miss counters (cachestats, admin dashboard)
+        # live here too, so with locmem they only count one process.
+    }
+}
+MEMBER_PAGE_CACHE_TIMEOUT = 300
+MEMBER_PAGE_CACHE_DISABLED = []   # e.g. ['user_charges'] to always render fresh
+SCHEME_CATALOG_MAX_AGE = 30   # seconds a process trusts its scheme catalog
+MEMBERS_SUMMARY_PAGE_SIZE = 50
 AUTHENTICATION_BACKENDS = [
-    'app.backends.EmailOrUsernameBackend',      # custom backend
-    'django.contrib.auth.backends.ModelBackend' # default backend
+    # Subclasses ModelBackend, so it also answers permission checks
+    'app.backends.EmailOrUsernameBackend',
 ]
+LOGIN_FAILURE_CACHE_TIMEOUT = 60
@@ -13,6 +13,7 @@ from app.views import (
     user_charges,
     user_rewards,
     run_monthly_now,
+    monthly_job_status_json,
     admin_add_user,
     admin_members,
     admin_dashboard,
@@ -24,11 +25,23 @@ from app.views import (
     export_member_single_csv,
     mark_charge_paid,
     export_members_csv,   # <-- FIXED (added)
+    admin_arrears,
+    export_ledger_changes,
+    admin_rollups,
+    rollups_json,
+    export_arrears_csv,
+    quick_mark_paid,
+    bulk_mark_paid_view,
+    admin_reconcile,
+    reconcile_rejects,
+    admin_import_members,
     login_redirect,
     admin_edit_profile,
 )
 
 urlpatterns = [
+    # Must come before admin.site.urls, which would swallow it
+    path("admin/mark-paid/<int:user_id>/", quick_mark_paid, name='quick_mark_paid'),
     path('admin/', admin.site.urls),
     # Default landing page = LOGIN PAGE
     path('', auth_views.LoginView.as_view(template_name="login.html"), name='login'),
@@ -50,7 +63,12 @@ urlpatterns = [
     path('admin-rewards/', admin_rewards, name='admin_rewards'),
     path('admin-add-user/', admin_add_user, name='admin_add_user'),
     path('admin-run-monthly/', run_monthly_now, name='run_monthly_now'),
+    path('admin-run-monthly/status/', monthly_job_status_json, name='monthly_job_status'),
     path('mark-charge-paid/<int:charge_id>/', mark_charge_paid, name='mark_charge_paid'),
+    path('admin-bulk-mark-paid/', bulk_mark_paid_view, name='bulk_mark_paid'),
+    path('admin-reconcile/', admin_reconcile, name='admin_reconcile'),
+    path('admin-reconcile/rejects/<str:token>/', reconcile_rejects, name='reconcile_rejects'),
+    path('admin-import-members/', admin_import_members, name='admin_import_members'),
     path('admin-members-summary/', admin_members_summary, name='admin_members_summary'),
     path('admin-member-summary/<str:member_id>/', admin_member_summary_single, name='admin_member_summary_single'),
 
@@ -61,6 +79,11 @@ urlpatterns = [
     # Members list + Export
     path('admin-members/', admin_members, name='admin_members'),
     path('admin-members/export/', export_members_csv, name='export_members_csv'),
+    path('admin-ledger-changes/', export_ledger_changes, name='export_ledger_changes'),
+    path('admin-arrears/', admin_arrears, name='admin_arrears'),
+    path('admin-rollups/', admin_rollups, name='admin_rollups'),
+    path('admin-rollups/json/', rollups_json, name='rollups_json'),
+    path('admin-arrears/export/', export_arrears_csv, name='export_arrears_csv'),
 
     # Password change
     path(
@@ -74,9 +97,6 @@ urlpatterns = [
         name='password_change_done'
     ),
 ]
-from app.views import quick_mark_paid
-
-path("admin/mark-paid/<int:user_id>/", quick_mark_paid),
 # Password Reset URLs
 path("password-reset/", 
      auth_views.PasswordResetView.as_view(template_name="password_reset.html"), 